@@ -0,0 +1,99 @@
+"""
+Measure the per-call overhead of rst2pdf_http.py diagnostics.
+
+Time a few hot helpers bare (the default) and wrapped with ``logger.catch(reraise=True)`` (what ``RST2PDF_HTTP_TRACE_CALLS=1`` restores), and a debug message below the log level as an f-string versus lazily formatted.
+
+Log records go to a null sink, so only the diagnostics overhead is timed.  Print a JSON report.
+
+Typical usage:
+
+    $ python benchmark_diagnostics.py
+    $ python benchmark_diagnostics.py --iterations 500000 --log_level DEBUG
+"""
+
+import argparse
+import timeit
+import json
+import sys
+import os
+
+from loguru import logger
+
+from rst2pdf_http import DEFAULT_LOG_LEVEL, VALID_LOG_LEVELS, Stylesheet, is_valid_ipv4addr, is_valid_ipv6addr
+
+DEFAULT_ITERATIONS = 200000
+DEFAULT_REPEAT = 7
+
+
+def get_bare_function(func):
+    """
+    Return ``func`` without its ``logger.catch()`` wrapper, whether or not RST2PDF_HTTP_TRACE_CALLS is set.
+    """
+    return getattr(func, "__wrapped__", func)
+
+
+def get_benchmark_cases():
+    """
+    Return ``{name: (before, after)}``; each is a zero-argument callable doing the same work.
+    """
+    cases = {}
+    for name, func, args in (
+        ("is_valid_ipv4addr", is_valid_ipv4addr, ("127.0.0.1",)),
+        ("is_valid_ipv6addr", is_valid_ipv6addr, ("::1",)),
+        ("get_rst2pdf_pageSetup_measure", Stylesheet.get_rst2pdf_pageSetup_measure, (None, "1.5cm")),
+    ):
+        bare = get_bare_function(func)
+        wrapped = logger.catch(reraise=True)(bare)
+        cases[f"{name} (catch per call -> bare)"] = (lambda wrapped=wrapped, args=args: wrapped(*args), lambda bare=bare, args=args: bare(*args))
+
+    page_size, font_size = "A4", 8
+    cases["debug message below the log level (f-string -> lazy)"] = (
+        lambda: logger.debug(f"stylesheet page size: {page_size}, font size: {font_size}"),
+        lambda: logger.debug("stylesheet page size: {}, font size: {}", page_size, font_size),
+    )
+    return cases
+
+
+def time_per_call_ns(before, after, iterations=DEFAULT_ITERATIONS, repeat=DEFAULT_REPEAT):
+    """
+    Return ``(before_ns, after_ns)`` per call.  Timings alternate so drift (i.e. CPU frequency) affects both sides; the fastest of ``repeat`` is the least disturbed by the rest of the machine.
+    """
+    before_timings = []
+    after_timings = []
+    for _ in range(repeat):
+        before_timings.append(timeit.timeit(before, number=iterations))
+        after_timings.append(timeit.timeit(after, number=iterations))
+    return min(before_timings) / iterations * 1e9, min(after_timings) / iterations * 1e9
+
+
+def run_benchmark(iterations=DEFAULT_ITERATIONS, repeat=DEFAULT_REPEAT, log_level="INFO"):
+    logger.remove()
+    logger.add(lambda _message: None, level=log_level)
+
+    results = {}
+    for name, (before, after) in get_benchmark_cases().items():
+        before_ns, after_ns = time_per_call_ns(before, after, iterations=iterations, repeat=repeat)
+        results[name] = {
+            "before_ns_per_call": round(before_ns, 1),
+            "after_ns_per_call": round(after_ns, 1),
+            "removed_ns_per_call": round(before_ns - after_ns, 1),
+            "speedup": round(before_ns / after_ns, 2) if after_ns > 0 else None,
+        }
+    return {"python": sys.version.split()[0], "log_level": log_level, "iterations": iterations, "repeat": repeat, "results": results}
+
+
+def parse_cli_args(sys_argv1):
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(__file__),
+        description="Measure the per-call overhead of rst2pdf_http.py diagnostics",
+        add_help=True,
+    )
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, action="store", help=f"Calls per timing; the default is {DEFAULT_ITERATIONS}.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, action="store", help=f"Timings per case (the fastest is reported); the default is {DEFAULT_REPEAT}.")
+    parser.add_argument("--log_level", type=str, default="INFO", choices=VALID_LOG_LEVELS, action="store", help=f"Log level of the null sink; the default is INFO (rst2pdf_http.py itself defaults to {DEFAULT_LOG_LEVEL}).")
+    return parser.parse_args(sys_argv1)
+
+
+if __name__ == "__main__":
+    args = parse_cli_args(sys.argv[1:])
+    print(json.dumps(run_benchmark(iterations=args.iterations, repeat=args.repeat, log_level=args.log_level), indent=4))
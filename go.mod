@@ -3,9 +3,11 @@ module filesystem_webserver
 go 1.21.4
 
 require (
+	github.com/fsnotify/fsnotify v1.7.0
 	github.com/gleich/logoru v0.0.0-20230101033757-d86cd895c7a1
 	github.com/gorilla/handlers v1.5.1
 	github.com/spf13/pflag v1.0.5
+	golang.org/x/net v0.17.0
 )
 
 require (
@@ -13,5 +15,6 @@ require (
 	github.com/felixge/httpsnoop v1.0.1 // indirect
 	github.com/mattn/go-colorable v0.1.8 // indirect
 	github.com/mattn/go-isatty v0.0.12 // indirect
-	golang.org/x/sys v0.0.0-20200810151505-1b9f1253b3ed // indirect
+	golang.org/x/sys v0.13.0 // indirect
+	golang.org/x/text v0.13.0 // indirect
 )
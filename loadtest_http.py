@@ -0,0 +1,329 @@
+"""
+Load-test ``filesystem_webserver`` on the loopback interface.
+
+Generate a directory with one large (pseudo-random, seeded) PDF-sized file, start ``filesystem_webserver`` on it, drive concurrent full and range GETs from local client threads, and print a JSON report.
+
+Typical usage:
+
+    $ make all
+    $ python loadtest_http.py --file_size_mb 50 --concurrency 16 --requests 400
+    $ python loadtest_http.py --server_args "--cacheBytes 0"
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, DEVNULL
+import http.client
+import threading
+import argparse
+import tempfile
+import platform
+import random
+import signal
+import socket
+import shlex
+import json
+import math
+import time
+import sys
+import os
+
+from loguru import logger
+
+from rst2pdf_http import catch
+
+DEFAULT_WEBSERVER_BINARY = "./filesystem_webserver"
+DEFAULT_FILE_SIZE_MB = 50
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS = 200
+DEFAULT_RANGE_FRACTION = 0.5
+DEFAULT_RANGE_BYTES = 1024 * 1024
+DEFAULT_SEED = 42
+DEFAULT_STARTUP_TIMEOUT = 10.0
+LOADTEST_FILENAME = "loadtest.pdf"
+READ_CHUNK_BYTES = 256 * 1024
+
+
+@catch
+def get_free_loopback_port():
+    """
+    Ask the kernel for an unused TCP port on 127.0.0.1.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@catch
+def write_loadtest_file(directory=None, size_bytes=0, seed=DEFAULT_SEED):
+    """
+    Write ``size_bytes`` of seeded pseudo-random data to ``directory``; the same seed always writes the same file.
+    """
+    rng = random.Random(seed)
+    filepath = os.path.normpath(f"{directory}/{LOADTEST_FILENAME}")
+    remaining = size_bytes
+    with open(filepath, "wb") as fh:
+        while remaining > 0:
+            chunk_size = min(remaining, READ_CHUNK_BYTES)
+            fh.write(rng.randbytes(chunk_size))
+            remaining -= chunk_size
+    return filepath
+
+
+@catch
+def wait_for_webserver(port=0, timeout=DEFAULT_STARTUP_TIMEOUT):
+    """
+    Poll until ``port`` accepts TCP connections on loopback; raise ``OSError()`` after ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    raise OSError(f"filesystem_webserver did not listen on 127.0.0.1:{port} within {timeout} seconds.")
+
+
+@catch
+def get_percentile(sorted_values, percentile):
+    """
+    Return the nearest-rank ``percentile`` of the already-sorted ``sorted_values``.
+    """
+    if len(sorted_values) == 0:
+        return None
+    rank = max(1, int(math.ceil(percentile / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+@catch
+def summarize_latencies(latencies):
+    """
+    Summarize latencies (in seconds) as milliseconds.
+    """
+    latencies = sorted(latencies)
+    if len(latencies) == 0:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "min_ms": round(latencies[0] * 1000.0, 3),
+        "p50_ms": round(get_percentile(latencies, 50) * 1000.0, 3),
+        "p95_ms": round(get_percentile(latencies, 95) * 1000.0, 3),
+        "p99_ms": round(get_percentile(latencies, 99) * 1000.0, 3),
+        "max_ms": round(latencies[-1] * 1000.0, 3),
+    }
+
+
+class LoadTestClient(object):
+    """
+    Issue the planned requests against the webserver with one keep-alive ``http.client`` connection per thread.
+    """
+
+    @catch
+    def __init__(self, port=0, file_size=0, range_bytes=DEFAULT_RANGE_BYTES):
+        self.port = port
+        self.file_size = file_size
+        self.range_bytes = min(range_bytes, file_size)
+        self.local = threading.local()
+
+    @catch
+    def get_connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            self.local.buffer = bytearray(READ_CHUNK_BYTES)
+        return self.local.connection
+
+    def do_request(self, range_start=None):
+        """
+        GET the load-test file (or a ``range_bytes`` slice of it starting at ``range_start``); return ``(kind, latency, bytes_read, error)``.
+        """
+        kind = "full" if range_start is None else "range"
+        headers = {}
+        expected_status = 200
+        expected_bytes = self.file_size
+        if range_start is not None:
+            headers["Range"] = f"bytes={range_start}-{range_start + self.range_bytes - 1}"
+            expected_status = 206
+            expected_bytes = self.range_bytes
+
+        bytes_read = 0
+        start = time.perf_counter()
+        try:
+            connection = self.get_connection()
+            connection.request("GET", f"/{LOADTEST_FILENAME}", headers=headers)
+            response = connection.getresponse()
+            view = memoryview(self.local.buffer)
+            while True:
+                count = response.readinto(view)
+                if count == 0:
+                    break
+                bytes_read += count
+            latency = time.perf_counter() - start
+        except (OSError, http.client.HTTPException) as eee:
+            # Drop the broken connection; the next request reconnects
+            if getattr(self.local, "connection", None) is not None:
+                self.local.connection.close()
+                self.local.connection = None
+            return (kind, time.perf_counter() - start, bytes_read, f"{type(eee).__name__}: {eee}")
+
+        if response.status != expected_status:
+            return (kind, latency, bytes_read, f"HTTP status {response.status}, expected {expected_status}")
+        if bytes_read != expected_bytes:
+            return (kind, latency, bytes_read, f"read {bytes_read} bytes, expected {expected_bytes}")
+        return (kind, latency, bytes_read, None)
+
+
+@catch
+def plan_requests(request_count=0, range_fraction=DEFAULT_RANGE_FRACTION, file_size=0, range_bytes=DEFAULT_RANGE_BYTES, seed=DEFAULT_SEED):
+    """
+    Return a seeded, reproducible list of range start offsets; ``None`` means a full GET.
+    """
+    rng = random.Random(seed)
+    max_start = max(0, file_size - min(range_bytes, file_size))
+    plan = []
+    for _ in range(request_count):
+        if rng.random() < range_fraction:
+            plan.append(rng.randint(0, max_start))
+        else:
+            plan.append(None)
+    return plan
+
+
+@catch
+def run_loadtest(cli_args=None):
+    """
+    Start the webserver on a generated directory, run the load test, and return the report as a dict.
+    """
+    if not os.path.exists(cli_args.webserver_binary):
+        raise OSError(f"{cli_args.webserver_binary} must exist; did you type `make all` before running the script?")
+
+    file_size = int(cli_args.file_size_mb * 1024 * 1024)
+    port = cli_args.port or get_free_loopback_port()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        logger.info("Writing {} byte load-test file to {}", file_size, temp_dir)
+        write_loadtest_file(directory=temp_dir, size_bytes=file_size, seed=cli_args.seed)
+
+        cmd = f"{cli_args.webserver_binary} --webserverPort {port} --webserverDirectory {temp_dir} {cli_args.server_args}"
+        logger.info("{}", cmd)
+        server = Popen(shlex.split(cmd), shell=False, stdout=DEVNULL, stderr=DEVNULL)
+        try:
+            wait_for_webserver(port=port, timeout=cli_args.startup_timeout)
+            client = LoadTestClient(port=port, file_size=file_size, range_bytes=cli_args.range_bytes)
+
+            # Warm up (i.e. fill any server-side cache) before measuring...
+            for _ in range(cli_args.warmup):
+                client.do_request(range_start=None)
+
+            plan = plan_requests(
+                request_count=cli_args.requests,
+                range_fraction=cli_args.range_fraction,
+                file_size=file_size,
+                range_bytes=cli_args.range_bytes,
+                seed=cli_args.seed,
+            )
+            logger.info("Running {} requests with concurrency {}", len(plan), cli_args.concurrency)
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=cli_args.concurrency) as executor:
+                results = list(executor.map(client.do_request, plan))
+            wall_time = time.perf_counter() - wall_start
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=10)
+            except Exception:
+                server.kill()
+
+    return build_report(cli_args=cli_args, cmd=cmd, file_size=file_size, results=results, wall_time=wall_time)
+
+
+@catch
+def build_report(cli_args=None, cmd="", file_size=0, results=None, wall_time=0.0):
+    errors = [ii for ii in results if ii[3] is not None]
+    successes = [ii for ii in results if ii[3] is None]
+    total_bytes = sum([ii[2] for ii in results])
+    report = {
+        "config": {
+            "webserver_cmd": cmd,
+            "file_size_bytes": file_size,
+            "concurrency": cli_args.concurrency,
+            "requests": cli_args.requests,
+            "range_fraction": cli_args.range_fraction,
+            "range_bytes": cli_args.range_bytes,
+            "warmup": cli_args.warmup,
+            "seed": cli_args.seed,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "wall_time_s": round(wall_time, 3),
+        "requests_ok": len(successes),
+        "requests_failed": len(errors),
+        "requests_per_second": round(len(successes) / wall_time, 3) if wall_time > 0 else None,
+        "throughput_mb_per_second": round(total_bytes / wall_time / (1024 * 1024), 3) if wall_time > 0 else None,
+        "latency": summarize_latencies([ii[1] for ii in successes]),
+        "latency_full": summarize_latencies([ii[1] for ii in successes if ii[0] == "full"]),
+        "latency_range": summarize_latencies([ii[1] for ii in successes if ii[0] == "range"]),
+        # Only keep a sample of errors; thousands of identical errors are not useful
+        "errors": sorted(set([ii[3] for ii in errors]))[:10],
+    }
+    return report
+
+
+@catch
+def parse_cli_args(sys_argv1):
+    """
+    Reference: https://docs.python.org/3/library/argparse.html
+    """
+    if isinstance(sys_argv1, (list, tuple)):
+        pass
+    else:
+        raise ValueError("`sys_argv1` must be a list or tuple with CLI options from `sys.argv[1:]`")
+
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(__file__),
+        description="Load-test filesystem_webserver on loopback and report JSON",
+        add_help=True,
+    )
+    parser_optional = parser.add_argument_group("optional")
+    parser_optional.add_argument("-b", "--webserver_binary", type=str, default=DEFAULT_WEBSERVER_BINARY, action="store", help=f"filesystem_webserver binary; the default is '{DEFAULT_WEBSERVER_BINARY}'.")
+    parser_optional.add_argument("--server_args", type=str, default="", action="store", help="Extra filesystem_webserver options, i.e. '--cacheBytes 0 --maxConnections 4'.")
+    parser_optional.add_argument("-p", "--port", type=int, default=0, action="store", help="Loopback TCP port; the default is a free port.")
+    parser_optional.add_argument("--file_size_mb", type=float, default=DEFAULT_FILE_SIZE_MB, action="store", help=f"Size of the generated file in MiB; the default is {DEFAULT_FILE_SIZE_MB}.")
+    parser_optional.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, action="store", help=f"Concurrent client connections; the default is {DEFAULT_CONCURRENCY}.")
+    parser_optional.add_argument("-r", "--requests", type=int, default=DEFAULT_REQUESTS, action="store", help=f"Total measured requests; the default is {DEFAULT_REQUESTS}.")
+    parser_optional.add_argument("--range_fraction", type=float, default=DEFAULT_RANGE_FRACTION, action="store", help=f"Fraction of requests which are range GETs; the default is {DEFAULT_RANGE_FRACTION}.")
+    parser_optional.add_argument("--range_bytes", type=int, default=DEFAULT_RANGE_BYTES, action="store", help=f"Bytes requested by each range GET; the default is {DEFAULT_RANGE_BYTES}.")
+    parser_optional.add_argument("--warmup", type=int, default=1, action="store", help="Unmeasured full GETs before the test; the default is 1.")
+    parser_optional.add_argument("--seed", type=int, default=DEFAULT_SEED, action="store", help=f"Seed for the file contents and request mix; the default is {DEFAULT_SEED}.")
+    parser_optional.add_argument("--startup_timeout", type=float, default=DEFAULT_STARTUP_TIMEOUT, action="store", help=f"Seconds to wait for the webserver to listen; the default is {DEFAULT_STARTUP_TIMEOUT}.")
+    parser_optional.add_argument("-o", "--output", type=str, default="-", action="store", help="Write the JSON report to this file; the default is stdout.")
+
+    args = parser.parse_args(sys_argv1)
+
+    if args.concurrency < 1:
+        raise ValueError("--concurrency must be at least 1.")
+    if not (0.0 <= args.range_fraction <= 1.0):
+        raise ValueError("--range_fraction must be between 0.0 and 1.0.")
+    if args.file_size_mb <= 0 or args.range_bytes < 1:
+        raise ValueError("--file_size_mb and --range_bytes must be positive.")
+
+    return args
+
+
+def main(sys_argv1=None):
+    """
+    Run loadtest_http.py with the CLI options in ``sys_argv1``; return the process exit code.
+    """
+    args = parse_cli_args(sys_argv1)
+    report = run_loadtest(cli_args=args)
+    if args.output == "-":
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=4)
+    return 1 if report["requests_failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    # The process boundary: log any uncaught exception once, with its traceback, and exit non-zero
+    with logger.catch(onerror=lambda _: sys.exit(1)):
+        sys.exit(main(sys.argv[1:]))
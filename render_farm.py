@@ -0,0 +1,506 @@
+"""
+Render many RestructuredText documents across several hosts.
+
+A coordinator ships each document, its include closure and the rst2pdf stylesheet to ``render_farm.py worker`` processes over TCP, and collects the PDFs.  Scheduling is largest-document-first; a job whose worker fails or disappears is retried on another worker.
+
+Typical usage:
+
+    $ python render_farm.py worker --listen 0.0.0.0:9101                              # on each render host
+    $ python render_farm.py coordinate --workers host1:9101,host2:9101 docs/*.rst --rst2pdf_http_args "-s 8 --page_size A4"
+    $ python render_farm.py bench --max_workers 4 docs/*.rst                           # local workers on loopback
+
+Wire protocol (both directions): a 4-byte big-endian header length, a UTF-8 JSON header, then the raw bytes of each blob whose length is listed in ``header["blobs"]``.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE
+import threading
+import argparse
+import tempfile
+import socket
+import struct
+import shlex
+import queue
+import json
+import time
+import sys
+import os
+import re
+
+from loguru import logger
+import yaml
+
+from rst2pdf_http import DEFAULT_LOG_LEVEL, VALID_LOG_LEVELS, RenderLimitExceeded, RenderWorker, Stylesheet, RST_DEPENDENCY_PATTERN, catch, configure_logging, scan_rst_dependencies, parse_cli_args as parse_rst2pdf_http_args
+
+MAX_HEADER_BYTES = 16 * 1024 * 1024
+DEFAULT_WORKER_PORT = 9101
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_JOB_TIMEOUT = 900.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+STYLESHEET_FILENAME = "rst2pdf_stylesheet.yml"
+# rst2pdf logs ``[ERROR] image.py:... Missing image file ...`` and docutils ``doc.rst:3: (ERROR/3) ...``, yet both still write a PDF and exit 0
+RENDER_ERROR_PATTERN = r"^\[ERROR\]|\((ERROR|SEVERE)/[34]\)"
+
+
+# The wire helpers are not wrapped with catch(); a closed connection is routine and handled by the callers
+def recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if chunk == b"":
+            raise ConnectionError("connection closed by peer")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock, header=None, blobs=()):
+    header = dict(header)
+    header["blobs"] = [len(blob) for blob in blobs]
+    encoded = json.dumps(header).encode()
+    sock.sendall(struct.pack(">I", len(encoded)) + encoded)
+    for blob in blobs:
+        sock.sendall(blob)
+
+
+def recv_message(sock):
+    """
+    Return ``(header, blobs)``; raise ``ConnectionError()`` if the peer went away.
+    """
+    (length,) = struct.unpack(">I", recv_exact(sock, 4))
+    if length > MAX_HEADER_BYTES:
+        raise ConnectionError(f"header of {length} bytes is too large")
+    header = json.loads(recv_exact(sock, length))
+    blobs = [recv_exact(sock, size) for size in header.get("blobs", [])]
+    return header, blobs
+
+
+@catch
+def parse_host_port(address=None, default_port=DEFAULT_WORKER_PORT):
+    """
+    Parse ``host:port`` (or ``[ipv6]:port``, or just ``host``) into ``(host, port)``.
+    """
+    mm = re.search(r"^\[(.+)\](?::(\d+))?$", address) or re.search(r"^([^:]+)(?::(\d+))?$", address)
+    if mm is None:
+        raise ValueError(f"{address} must look like host:port.")
+    return mm.group(1), int(mm.group(2) or default_port)
+
+
+@catch
+def get_safe_relpath(relpath=None):
+    """
+    Refuse absolute paths and ``..`` in paths received from the coordinator.
+    """
+    normalized = os.path.normpath(relpath)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith("../"):
+        raise ValueError(f"{relpath} escapes the job directory.")
+    return normalized
+
+
+class RenderJob(object):
+    """
+    One document and the include closure shipped with it.
+
+    Files are mirrored under the worker's job directory at their absolute path (without the leading ``/``).
+
+    Absolute directive references in the shipped RestructuredText are rewritten as relative ones, so includes such as ``~/.rst2pdf/custom_rst_imports/localtime_today_iso.rst`` resolve on the worker too.
+    """
+
+    @catch
+    def __init__(self, start_filepath=None, output_filepath=None):
+        self.start_filepath = os.path.abspath(start_filepath)
+        self.output_filepath = output_filepath
+        dependencies, missing = scan_rst_dependencies(self.start_filepath)
+        for dependency in missing:
+            logger.warning(f"{start_filepath}: missing include or image {dependency}")
+        self.filepaths = [self.start_filepath] + [ii for ii in dependencies if ii not in missing]
+        self.size = sum([os.path.getsize(ii) for ii in self.filepaths])
+        self.attempts = 0
+        self.errors = []
+
+    # This is on the RenderJob() class
+    @catch
+    def get_payload(self):
+        """
+        Return ``(relpaths, blobs)`` for the wire.
+        """
+        relpaths = []
+        blobs = []
+        for filepath in self.filepaths:
+            with open(filepath, "rb") as fh:
+                content = fh.read()
+            if filepath.endswith((".rst", ".txt")):
+                content = self.rewrite_absolute_references(filepath, content)
+            relpaths.append(filepath.lstrip("/"))
+            blobs.append(content)
+        return relpaths, blobs
+
+    # This is on the RenderJob() class
+    @catch
+    def rewrite_absolute_references(self, filepath, content):
+        def relativize(mm):
+            reference = os.path.expanduser(mm.group(3).decode(errors="surrogateescape"))
+            if not os.path.isabs(reference):
+                return mm.group(0)
+            relative = os.path.relpath(reference, os.path.dirname(filepath))
+            return mm.group(1) + relative.encode(errors="surrogateescape") + mm.group(4)
+
+        return re.sub(RST_DEPENDENCY_PATTERN.encode(), relativize, content, flags=re.MULTILINE)
+
+
+class FarmWorker(object):
+    """
+    Accept jobs from coordinators, one at a time, and render them in a long-lived (recycled) ``RenderWorker()``.
+    """
+
+    @catch
+    def __init__(self, host="127.0.0.1", port=DEFAULT_WORKER_PORT, render_timeout=DEFAULT_JOB_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.render_worker = RenderWorker(timeout=render_timeout)
+        self.jobs = 0
+
+    # This is on the FarmWorker() class
+    @catch
+    def serve_forever(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        with socket.socket(family, socket.SOCK_STREAM) as listener:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((self.host, self.port))
+            listener.listen()
+            # bench reads the bound port from this line...
+            print(f"LISTENING {listener.getsockname()[1]}", flush=True)
+            logger.info("Render farm worker listening on {}:{}", self.host, listener.getsockname()[1])
+            try:
+                while True:
+                    connection, peer = listener.accept()
+                    with connection:
+                        self.serve_connection(connection, peer)
+            finally:
+                self.render_worker.stop()
+
+    # This is on the FarmWorker() class
+    @catch
+    def serve_connection(self, connection, peer):
+        logger.info("Coordinator {} connected", peer[0])
+        while True:
+            try:
+                header, blobs = recv_message(connection)
+            except ConnectionError:
+                logger.info("Coordinator {} disconnected", peer[0])
+                return
+            if header.get("type") != "render":
+                send_message(connection, {"type": "error", "error": f"unknown message type {header.get('type')}"})
+                continue
+            response, pdf = self.render(header, blobs)
+            send_message(connection, response, [pdf] if pdf is not None else [])
+
+    # This is on the FarmWorker() class
+    @catch
+    def render(self, header, blobs):
+        response = {"type": "result", "job_id": header["job_id"], "returncode": 1, "stderr": "", "error": None, "runtime": 0.0, "peak_rss_kb": None}
+        with tempfile.TemporaryDirectory() as job_directory:
+            try:
+                for relpath, blob in zip(header["files"], blobs):
+                    filepath = os.path.join(job_directory, get_safe_relpath(relpath))
+                    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                    with open(filepath, "wb") as fh:
+                        fh.write(blob)
+                stylesheet_directory = os.path.join(job_directory, ".stylesheet")
+                os.makedirs(stylesheet_directory)
+                with open(os.path.join(stylesheet_directory, STYLESHEET_FILENAME), "w") as fh:
+                    fh.write(header["stylesheet"])
+
+                start_filepath = os.path.join(job_directory, get_safe_relpath(header["document"]))
+                finish_filepath = os.path.join(job_directory, ".output.pdf")
+                result = self.render_worker.render([f"--stylesheet-path={stylesheet_directory}", f"--stylesheets={STYLESHEET_FILENAME}", start_filepath, "-o", finish_filepath])
+            except (RenderLimitExceeded, ValueError, OSError) as eee:
+                response["error"] = f"{type(eee).__name__}: {eee}"
+                return response, None
+
+            self.jobs += 1
+            response.update(
+                {
+                    "returncode": result["returncode"],
+                    "stderr": result["stderr"].decode(errors="replace").replace(job_directory, ""),
+                    "error": result["error"],
+                    "runtime": result["runtime"],
+                    "peak_rss_kb": result["peak_rss_kb"],
+                }
+            )
+            if result["returncode"] > 0 or not os.path.exists(finish_filepath):
+                return response, None
+            with open(finish_filepath, "rb") as fh:
+                return response, fh.read()
+
+
+class FarmCoordinator(object):
+    """
+    Distribute ``RenderJob()`` objects over ``workers`` (a list of ``(host, port)``), largest document first.
+
+    Each worker gets one coordinator thread and one persistent connection.  A job which fails, or whose worker is lost, is requeued until it has been tried ``max_retries + 1`` times; a lost worker is not used again.
+    """
+
+    @catch
+    def __init__(self, workers=None, stylesheet_yaml="", max_retries=DEFAULT_MAX_RETRIES, job_timeout=DEFAULT_JOB_TIMEOUT):
+        if len(workers or []) == 0:
+            raise ValueError("At least one render farm worker is required.")
+        self.workers = workers
+        self.stylesheet_yaml = stylesheet_yaml
+        self.max_retries = max_retries
+        self.job_timeout = job_timeout
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.retries = 0
+        self.worker_jobs = {}
+        self.finished = []
+        self.failed = []
+
+    # This is on the FarmCoordinator() class
+    @catch
+    def run(self, jobs=None):
+        """
+        Render every job; return a report dict.
+        """
+        job_queue = queue.PriorityQueue()
+        for index, job in enumerate(jobs):
+            # Largest first keeps a huge document from starting last and dominating the wall-clock time
+            job_queue.put((-job.size, index, job))
+        self.pending = len(jobs)
+
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as executor:
+            list(executor.map(lambda worker: self.drive_worker(worker, job_queue), self.workers))
+        wall_time = time.perf_counter() - wall_start
+
+        # Jobs still queued had no live worker left
+        while not job_queue.empty():
+            _, _, job = job_queue.get()
+            job.errors.append("no render farm workers left")
+            self.failed.append(job)
+
+        total_bytes = sum([job.size for job in jobs])
+        return {
+            "workers": len(self.workers),
+            "documents": len(jobs),
+            "succeeded": len(self.finished),
+            "failed": len(self.failed),
+            "retries": self.retries,
+            "wall_time_s": round(wall_time, 3),
+            "documents_per_second": round(len(self.finished) / wall_time, 3) if wall_time > 0 else None,
+            "input_bytes_per_second": round(total_bytes / wall_time, 1) if wall_time > 0 else None,
+            "worker_jobs": {f"{host}:{port}": count for (host, port), count in sorted(self.worker_jobs.items())},
+            "failures": {job.start_filepath: job.errors for job in self.failed},
+        }
+
+    # This is on the FarmCoordinator() class
+    @catch
+    def drive_worker(self, worker, job_queue):
+        host, port = worker
+        try:
+            connection = socket.create_connection((host, port), timeout=DEFAULT_CONNECT_TIMEOUT)
+        except OSError as eee:
+            logger.error(f"Render farm worker {host}:{port} is unreachable: {eee}")
+            return
+        connection.settimeout(self.job_timeout)
+
+        job = None
+        with connection:
+            try:
+                while True:
+                    with self.lock:
+                        if self.pending == 0:
+                            return
+                    try:
+                        _, index, job = job_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        # Another worker holds the last jobs; wait in case they are requeued
+                        continue
+
+                    job.attempts += 1
+                    try:
+                        relpaths, blobs = job.get_payload()
+                        send_message(connection, {"type": "render", "job_id": index, "document": relpaths[0], "files": relpaths, "stylesheet": self.stylesheet_yaml}, blobs)
+                        response, pdfs = recv_message(connection)
+                    except (OSError, ConnectionError) as eee:
+                        logger.error(f"Lost render farm worker {host}:{port}: {eee}")
+                        self.retry_or_fail(job, index, job_queue, f"{host}:{port} lost: {eee}")
+                        job = None
+                        return
+
+                    render_errors = [ii for ii in response.get("stderr", "").splitlines() if re.search(RENDER_ERROR_PATTERN, ii)]
+                    if render_errors:
+                        # A broken document renders the same everywhere, so it is not retried
+                        logger.warning(f"{host}:{port} rendered {job.start_filepath} with errors: {render_errors}")
+                        self.fail(job, f"{host}:{port}: " + "; ".join(render_errors))
+                    elif response.get("returncode") == 0 and len(pdfs) == 1:
+                        try:
+                            with open(job.output_filepath, "wb") as fh:
+                                fh.write(pdfs[0])
+                        except OSError as eee:
+                            # A local problem; rendering the job again elsewhere would not help
+                            logger.error(f"Cannot write {job.output_filepath}: {eee}")
+                            self.fail(job, f"cannot write {job.output_filepath}: {eee}")
+                            job = None
+                            continue
+                        logger.info("{}:{} rendered {} in {:.3f} seconds (peak RSS {} KiB)", host, port, job.output_filepath, response["runtime"], response["peak_rss_kb"])
+                        with self.lock:
+                            self.finished.append(job)
+                            self.worker_jobs[worker] = self.worker_jobs.get(worker, 0) + 1
+                            self.pending -= 1
+                    else:
+                        error = response.get("error") or response.get("stderr", "").strip() or "unknown error"
+                        logger.warning(f"{host}:{port} failed to render {job.start_filepath}: {error}")
+                        self.retry_or_fail(job, index, job_queue, f"{host}:{port}: {error}")
+                    job = None
+            finally:
+                # Never let an escaping exception strand a job; the other threads wait until ``pending`` is 0
+                if job is not None:
+                    self.fail(job, f"{host}:{port}: the coordinator thread failed")
+
+    # This is on the FarmCoordinator() class
+    @catch
+    def fail(self, job, error):
+        job.errors.append(error)
+        with self.lock:
+            self.failed.append(job)
+            self.pending -= 1
+
+    # This is on the FarmCoordinator() class
+    @catch
+    def retry_or_fail(self, job, index, job_queue, error):
+        job.errors.append(error)
+        with self.lock:
+            if job.attempts <= self.max_retries:
+                self.retries += 1
+                job_queue.put((-job.size, index, job))
+            else:
+                self.failed.append(job)
+                self.pending -= 1
+
+
+@catch
+def get_stylesheet_yaml(rst2pdf_http_args=""):
+    """
+    Build the rst2pdf stylesheet from ``rst2pdf_http.py`` options, i.e. ``"-s 8 --page_size A4"``.
+    """
+    cli_args = parse_rst2pdf_http_args(shlex.split(rst2pdf_http_args))
+    stylesheet = Stylesheet(cli_args=cli_args)
+    return yaml.dump(data=stylesheet.get_rst2pdf_data_dict(), default_flow_style=False)
+
+
+@catch
+def get_render_jobs(filepaths=None, output_directory=None):
+    jobs = []
+    for filepath in filepaths:
+        stem = os.path.splitext(os.path.basename(filepath))[0]
+        directory = output_directory or os.path.dirname(os.path.abspath(filepath))
+        jobs.append(RenderJob(start_filepath=filepath, output_filepath=os.path.join(directory, f"{stem}.pdf")))
+    if output_directory is not None:
+        os.makedirs(output_directory, exist_ok=True)
+    return jobs
+
+
+@catch
+def start_local_workers(count=1, render_timeout=DEFAULT_JOB_TIMEOUT, log_level=DEFAULT_LOG_LEVEL):
+    """
+    Start ``count`` ``render_farm.py worker`` processes on free loopback ports; return ``[(process, (host, port))]``.
+    """
+    workers = []
+    for _ in range(count):
+        cmd = f"{sys.executable} {os.path.abspath(__file__)} --log_level {log_level} worker --listen 127.0.0.1:0 --render_timeout {render_timeout}"
+        process = Popen(shlex.split(cmd), shell=False, stdout=PIPE, text=True)
+        line = process.stdout.readline()
+        mm = re.search(r"^LISTENING (\d+)", line)
+        if mm is None:
+            process.kill()
+            raise OSError(f"-->{cmd}<-- did not start listening.")
+        workers.append((process, ("127.0.0.1", int(mm.group(1)))))
+    return workers
+
+
+@catch
+def parse_cli_args(sys_argv1):
+    """
+    Reference: https://docs.python.org/3/library/argparse.html
+    """
+    if isinstance(sys_argv1, (list, tuple)):
+        pass
+    else:
+        raise ValueError("`sys_argv1` must be a list or tuple with CLI options from `sys.argv[1:]`")
+
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(__file__),
+        description="Render RestructuredText documents across several rst2pdf workers",
+        add_help=True,
+    )
+    parser.add_argument("--log_level", type=str, default=DEFAULT_LOG_LEVEL, choices=VALID_LOG_LEVELS, action="store", help=f"Only log messages at or above this level; the default is {DEFAULT_LOG_LEVEL}.")
+    parser.add_argument("-q", "--quiet", default=False, action="store_true", help="Only log warnings and errors.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    parser_worker = subparsers.add_parser("worker", help="Render jobs sent by a coordinator.")
+    parser_worker.add_argument("--listen", type=str, default=f"127.0.0.1:{DEFAULT_WORKER_PORT}", action="store", help=f"host:port to listen on; the default is 127.0.0.1:{DEFAULT_WORKER_PORT}.")
+    parser_worker.add_argument("--render_timeout", type=float, default=DEFAULT_JOB_TIMEOUT, action="store", help=f"Kill rst2pdf after this many wall-clock seconds; the default is {DEFAULT_JOB_TIMEOUT}.")
+
+    for name, help_text in (("coordinate", "Render documents on remote workers."), ("bench", "Start local loopback workers and report throughput as workers are added.")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("documents", type=str, nargs="+", help="RestructuredText documents.")
+        subparser.add_argument("--rst2pdf_http_args", type=str, default="", action="store", help="rst2pdf_http.py stylesheet options, i.e. '-s 8 --page_size A4'.")
+        subparser.add_argument("-o", "--output_directory", type=str, default=None, action="store", help="Write the PDFs here; the default is next to each document.")
+        subparser.add_argument("--max_retries", type=int, default=DEFAULT_MAX_RETRIES, action="store", help=f"Retry a failed or lost job this many times; the default is {DEFAULT_MAX_RETRIES}.")
+        subparser.add_argument("--job_timeout", type=float, default=DEFAULT_JOB_TIMEOUT, action="store", help=f"Consider a worker lost after this many seconds without a result; the default is {DEFAULT_JOB_TIMEOUT}.")
+    subparsers.choices["coordinate"].add_argument("--workers", type=str, required=True, action="store", help="Comma-separated worker host:port list.")
+    subparsers.choices["bench"].add_argument("--max_workers", type=int, default=4, action="store", help="Measure with 1 .. max_workers local workers; the default is 4.")
+
+    return parser.parse_args(sys_argv1)
+
+
+def main(sys_argv1=None):
+    """
+    Run render_farm.py with the CLI options in ``sys_argv1``; return the process exit code.
+    """
+    args = parse_cli_args(sys_argv1)
+    log_level = configure_logging(log_level=args.log_level, quiet=args.quiet)
+
+    if args.mode == "worker":
+        host, port = parse_host_port(args.listen)
+        FarmWorker(host=host, port=port, render_timeout=args.render_timeout).serve_forever()
+
+    elif args.mode == "coordinate":
+        coordinator = FarmCoordinator(
+            workers=[parse_host_port(ii.strip()) for ii in args.workers.split(",") if ii.strip() != ""],
+            stylesheet_yaml=get_stylesheet_yaml(args.rst2pdf_http_args),
+            max_retries=args.max_retries,
+            job_timeout=args.job_timeout,
+        )
+        report = coordinator.run(jobs=get_render_jobs(filepaths=args.documents, output_directory=args.output_directory))
+        print(json.dumps(report, indent=4))
+        return 1 if report["failed"] > 0 else 0
+
+    elif args.mode == "bench":
+        stylesheet_yaml = get_stylesheet_yaml(args.rst2pdf_http_args)
+        local_workers = start_local_workers(count=args.max_workers, log_level=log_level)
+        reports = []
+        try:
+            for worker_count in range(1, args.max_workers + 1):
+                coordinator = FarmCoordinator(
+                    workers=[address for _, address in local_workers[:worker_count]],
+                    stylesheet_yaml=stylesheet_yaml,
+                    max_retries=args.max_retries,
+                    job_timeout=args.job_timeout,
+                )
+                reports.append(coordinator.run(jobs=get_render_jobs(filepaths=args.documents, output_directory=args.output_directory)))
+        finally:
+            for process, _ in local_workers:
+                process.terminate()
+                process.wait()
+        print(json.dumps({"cpus": os.cpu_count(), "runs": reports}, indent=4))
+        return 1 if any([report["failed"] > 0 for report in reports]) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    # The process boundary: log any uncaught exception once, with its traceback, and exit non-zero
+    with logger.catch(onerror=lambda _: sys.exit(1)):
+        sys.exit(main(sys.argv[1:]))
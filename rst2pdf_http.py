@@ -2,23 +2,38 @@
 
 """
 # subprocess.run() is generally-recommended instead of subprocess.call()
+from concurrent.futures import ProcessPoolExecutor
 from subprocess import run, call
 from functools import wraps
+import multiprocessing
+import statistics
 import ipaddress
+import threading
+import sqlite3
+import asyncio
+import traceback
 import datetime
 import argparse
+import hashlib
 import tempfile
 import warnings
 import pathlib
+import urllib.request
+import resource
 import shutil
+import signal
 import shlex
+import fcntl
+import errno
 import json
 import time
 import sys
+import io
 import os
 import re
 
 from rich.console import Console
+from rich.table import Table
 from loguru import logger
 import yaml
 
@@ -92,6 +107,35 @@ DEFAULT_TERMINAL_ENCODING = Console().encoding
 DEFAULT_START_FILENAME_SUFFIX = "rst"
 CUSTOM_STYLESHEET_DIRECTORY = DEFAULT_STYLESHEET_DIRECTORY
 CUSTOM_RST_IMPORTS_FILEPATH = f"{CUSTOM_STYLESHEET_DIRECTORY}"
+DEFAULT_SHARED_WEBSERVER_DIRECTORY = os.path.expanduser("~/.rst2pdf/shared_webserver")
+SHARED_WEBSERVER_REGISTRY_FILENAME = "registry.json"
+# filesystem_webserver --shared answers here; registry.json itself is not served
+SHARED_WEBSERVER_STATUS_PATH = "/.rst2pdf_http/status"
+DEFAULT_RENDER_TIMEOUT = 900.0
+DEFAULT_RENDER_CPU_LIMIT = 600
+DEFAULT_RENDER_MEMORY_LIMIT_MB = 4096
+DEFAULT_RENDER_MAX_JOBS = 20
+DEFAULT_RENDER_MAX_RSS_MB = 1024
+DOCUTILS_LEVEL_NAMES = {
+    0: "DEBUG",
+    1: "INFO",
+    2: "WARNING",
+    3: "ERROR",
+    4: "SEVERE",
+}
+VALID_CHECK_FORMATS = set(
+    {
+        "json",
+        "text",
+    }
+)
+DEFAULT_CHECK_FORMAT = "json"
+GENERATED_INCLUDES_STATE_FILENAME = ".generated_includes.json"
+DEFAULT_VERSION_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "version.json")
+DEFAULT_BUILD_HISTORY_FILEPATH = os.path.expanduser("~/.rst2pdf/build_history.sqlite3")
+DEFAULT_REPORT_THRESHOLD = 0.25
+DEFAULT_REPORT_BUILDS = 10
+CHECK_FAILURE_LEVEL = 3
 
 
 class DummyLoggerProperty(object):
@@ -141,7 +185,47 @@ class DummyLoggerProperty(object):
         return outside_wrapper
 
 
-@logger.catch(reraise=True)
+# Diagnostics: exceptions are captured once, at the process boundary (``main()``, the render worker and the check pool), instead of by a ``logger.catch()`` wrapper around every helper.
+# RST2PDF_HTTP_TRACE_CALLS=1 wraps every ``@catch`` function again, logging each exception with its variable values where it was raised.  It is read at import time, when decorators are applied.
+TRACE_CALLS = os.environ.get("RST2PDF_HTTP_TRACE_CALLS", "0").strip().lower() not in ("", "0", "false", "no")
+# Set by configure_logging() so spawned render workers and render farm workers log at the same level
+LOG_LEVEL_ENVIRONMENT_NAME = "RST2PDF_HTTP_LOG_LEVEL"
+VALID_LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")
+DEFAULT_LOG_LEVEL = "DEBUG"
+QUIET_LOG_LEVEL = "WARNING"
+
+
+def catch(func):
+    """
+    Return ``func`` wrapped with ``logger.catch(reraise=True)`` if ``TRACE_CALLS`` is set; otherwise return ``func`` itself, so calling it costs nothing extra.
+    """
+    if TRACE_CALLS:
+        return logger.catch(reraise=True)(func)
+    return func
+
+
+def configure_logging(log_level=DEFAULT_LOG_LEVEL, quiet=False):
+    """
+    Replace loguru's default stderr handler with one at ``log_level`` (``QUIET_LOG_LEVEL`` if ``quiet``).
+
+    Use ``logger.debug("... {}", value)`` rather than f-strings on hot paths: loguru returns before formatting a message below every handler's level.
+    """
+    if quiet is True:
+        log_level = QUIET_LOG_LEVEL
+    if log_level not in VALID_LOG_LEVELS:
+        raise ValueError(f"{log_level} is an invalid log level. Choose from: {VALID_LOG_LEVELS}")
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+    os.environ[LOG_LEVEL_ENVIRONMENT_NAME] = log_level
+    return log_level
+
+
+# A spawned render worker re-imports this module; inherit the parent's log level
+if os.environ.get(LOG_LEVEL_ENVIRONMENT_NAME, "") in VALID_LOG_LEVELS:
+    configure_logging(log_level=os.environ[LOG_LEVEL_ENVIRONMENT_NAME])
+
+
+@catch
 def check_file_exists(filepath=None):
     """
     Check whether ``filepath`` exists; if so, return True.
@@ -173,8 +257,8 @@ def check_file_exists(filepath=None):
         raise ValueError(f"{filepath} must be a string.")
 
     abspath = os.path.abspath(os.path.expanduser(os.path.normpath(f"{filepath}")))
-    logger.info(f"    filepath: {filepath}")
-    logger.debug(f"        checking: {abspath}")
+    logger.info("    filepath: {}", filepath)
+    logger.debug("        checking: {}", abspath)
 
     if os.path.exists(abspath):
         return True
@@ -182,13 +266,13 @@ def check_file_exists(filepath=None):
         raise OSError(f"{abspath} must exist.")
 
 
-@logger.catch(reraise=True)
+@catch
 def check_supported_platform():
     if sys.platform not in VALID_PLATFORMS:
         raise OSError(f"{sys.platform} is not supported")
 
 
-@logger.catch(reraise=True)
+@catch
 def get_unix_listening_port_sockets(address_family=None, tcp_port=None):
     """
         Return True if the TCP port has a socket in the table.  Return False if the TCP port is not open.
@@ -205,7 +289,7 @@ def get_unix_listening_port_sockets(address_family=None, tcp_port=None):
     udp        0      0 0.0.0.0:123             0.0.0.0:*
         $
     """
-    logger.info(f"Checking that {address_family} TCP port {tcp_port} is open.")
+    logger.info("Checking that {} TCP port {} is open.", address_family, tcp_port)
     if address_family in VALID_IPADDRESS_FAMILIES:
         pass
     else:
@@ -235,7 +319,7 @@ def get_unix_listening_port_sockets(address_family=None, tcp_port=None):
             if state.lower() == "listen":
                 if proto == "tcp" or proto == "tcp6":
                     if local_address_port.split(":")[-1] == str(tcp_port):
-                        logger.debug("    " + line)
+                        logger.debug("    {}", line)
                         port_open = False
                         break
 
@@ -244,7 +328,7 @@ def get_unix_listening_port_sockets(address_family=None, tcp_port=None):
 
 class Stylesheet(object):
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def __init__(self, cli_args=None, **kwargs):
         """
         Write a custom rst2pdf Stylesheet with ``font_name``, ``font_size` and ``font_attrs``.
@@ -269,17 +353,17 @@ class Stylesheet(object):
             raise ValueError(f"Stylesheet(font_attrs='''{font_attrs}''' {type(font_attrs)}) must be a `list` or None.")
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def __repr__(self):
         return f"""font_name: {self.cli_args.font_name}, font_size: {self.cli_args.font_size}, font_attrs: {self.cli_args.font_attrs}"""
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def __str__(self):
         return f"""<Stylesheet {self.__repr__()}>"""
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def save_stylesheet_yaml(self, directory=CUSTOM_STYLESHEET_DIRECTORY, filename=DEFAULT_STYLESHEET_FILENAME):
         """Use PyYaml to save the dict returned by `get_rst2pdf_data_dict()` as an rst2pdf stylesheet"""
         try:
@@ -291,7 +375,7 @@ class Stylesheet(object):
             yaml.dump(data=self.get_rst2pdf_data_dict(), stream=fh, default_flow_style=False)
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def get_rst2pdf_styles_fontName(self, font_name=""):
         """Get the rst2pdf fontName, which usually looks like: 'fontMonoBoldItalic'."""
         if font_name in VALID_FONT_NAMES:
@@ -308,7 +392,7 @@ class Stylesheet(object):
             return font_name
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def get_rst2pdf_pageSetup_size(self, page_size="", page_orientation="Portriat"):
         """Get the rst2pdf pageSetup size, which usually looks like: 'A5-landscape'."""
         if page_size in VALID_PAGE_SIZES:
@@ -327,7 +411,7 @@ class Stylesheet(object):
 
         return page_size
 
-    @logger.catch(reraise=True)
+    @catch
     def get_rst2pdf_pageSetup_measure(self, measure=""):
         mm = re.search(r"^\s*(\d+)(\.\d+)*\s*(in|IN|cm|CM)\s*$", measure)
         if isinstance(mm, re.Match):
@@ -341,7 +425,7 @@ class Stylesheet(object):
             raise ValueError()
 
     # This is on the Stylesheet() class
-    @logger.catch(reraise=True)
+    @catch
     def get_rst2pdf_data_dict(self):
         """
         Create the most essential rst2pdf stylesheet from scratch.
@@ -393,11 +477,388 @@ class Stylesheet(object):
         return page_stylesheet
 
 
+class RenderLimitExceeded(OSError):
+    """
+    A render worker was killed (or gave up) because a build exceeded its memory, CPU or wall-clock limit.
+    """
+
+    pass
+
+
+def get_proc_status_kb(field=""):
+    """
+    Return a ``/proc/self/status`` memory field (i.e. ``VmRSS`` or ``VmHWM``) in KiB, or None if it is not available.
+    """
+    try:
+        with open("/proc/self/status", "r") as fh:
+            for line in fh:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def is_memory_limit_failure(eee=None, memory_limit_mb=0):
+    """
+    Return True if the exception ``eee`` most likely comes from an allocation refused by ``RLIMIT_AS``.
+
+    Only some allocations surface as ``MemoryError``: C extensions report ``SystemError: error return without exception set`` and ``dlopen()`` reports ``ImportError: ... failed to map segment from shared object``.
+
+    As a last resort, a peak address space (``VmPeak``) within 10% of the limit counts as hitting it.
+    """
+    if isinstance(eee, MemoryError) or getattr(eee, "errno", None) == errno.ENOMEM:
+        return True
+    if memory_limit_mb <= 0:
+        return False
+    if isinstance(eee, SystemError) or "failed to map segment" in str(eee):
+        return True
+    vm_peak_kb = get_proc_status_kb("VmPeak")
+    return vm_peak_kb is not None and vm_peak_kb >= memory_limit_mb * 1024 * 0.9
+
+
+def render_worker_main(connection, memory_limit_mb=0):
+    """
+    Run in the render worker process: import rst2pdf once, then render each ``(rst2pdf_argv, cpu_limit)`` job received on ``connection`` until ``None`` is received.
+
+    This is the target of a ``multiprocessing`` spawn; it is deliberately not wrapped with ``logger.catch()``.
+    """
+    if memory_limit_mb > 0:
+        memory_limit = int(memory_limit_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    import_error = None
+    try:
+        from rst2pdf.createpdf import main as rst2pdf_main
+    except Exception as eee:
+        # Reply to the first job with the evidence instead of dying with a bare exitcode
+        rst2pdf_main = None
+        import_error = "MemoryError" if is_memory_limit_failure(eee, memory_limit_mb) else traceback.format_exc()
+
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            # The parent exited without sending ``None``
+            break
+        if job is None:
+            break
+        if rst2pdf_main is None:
+            connection.send({"returncode": 1, "stderr": b"", "error": import_error, "runtime": 0.0, "peak_rss_kb": get_proc_status_kb("VmHWM"), "rss_kb": get_proc_status_kb("VmRSS")})
+            break
+        rst2pdf_argv, cpu_limit = job
+
+        if cpu_limit > 0:
+            # RLIMIT_CPU counts the whole process lifetime, so allow ``cpu_limit`` more seconds than this worker already used...
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft_limit = int(usage.ru_utime + usage.ru_stime) + int(cpu_limit)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+
+        # Reset the peak RSS (VmHWM) so it is reported per build; this needs Linux 4.0 or later
+        try:
+            with open("/proc/self/clear_refs", "w") as fh:
+                fh.write("5")
+        except OSError:
+            pass
+
+        returncode = 0
+        error = None
+        runtime_start = time.time()
+        sys.stderr.flush()
+        saved_stderr_fd = os.dup(2)
+        with tempfile.TemporaryFile() as stderr_fh:
+            # rst2pdf and docutils write warnings to stderr; capture them like subprocess.run() did
+            os.dup2(stderr_fh.fileno(), 2)
+            try:
+                rst2pdf_main(rst2pdf_argv)
+            except SystemExit as eee:
+                returncode = eee.code if isinstance(eee.code, int) else (0 if eee.code is None else 1)
+            except Exception as eee:
+                returncode = 1
+                error = "MemoryError" if is_memory_limit_failure(eee, memory_limit_mb) else traceback.format_exc()
+            finally:
+                sys.stderr.flush()
+                os.dup2(saved_stderr_fd, 2)
+                os.close(saved_stderr_fd)
+            stderr_fh.seek(0)
+            stderr = stderr_fh.read()
+
+        connection.send(
+            {
+                "returncode": returncode,
+                "stderr": stderr,
+                "error": error,
+                "runtime": time.time() - runtime_start,
+                "peak_rss_kb": get_proc_status_kb("VmHWM"),
+                "rss_kb": get_proc_status_kb("VmRSS"),
+            }
+        )
+        if error == "MemoryError":
+            # The heap may be fragmented or half-built; let the parent start a fresh worker
+            break
+
+
+class RenderWorker(object):
+    """
+    Run rst2pdf builds in a separate, resource-limited worker process.
+
+    The worker applies ``RLIMIT_AS`` (``memory_limit_mb``) and a per-build ``RLIMIT_CPU`` (``cpu_limit`` seconds); the parent enforces a wall-clock ``timeout``.
+
+    The worker is recycled after ``max_jobs`` builds or when its resident memory grows past ``max_rss_mb``, so one huge document cannot leave a bloated process behind.  A build that exceeds a limit raises ``RenderLimitExceeded()``.
+
+    :Example:
+
+    >>> with RenderWorker(timeout=60.0) as worker:
+    ...     result = worker.render(["doc.rst", "-o", "doc.pdf"])
+    """
+
+    @catch
+    def __init__(self, timeout=DEFAULT_RENDER_TIMEOUT, cpu_limit=DEFAULT_RENDER_CPU_LIMIT, memory_limit_mb=DEFAULT_RENDER_MEMORY_LIMIT_MB, max_jobs=DEFAULT_RENDER_MAX_JOBS, max_rss_mb=DEFAULT_RENDER_MAX_RSS_MB):
+        if max_jobs < 1:
+            raise ValueError(f"max_jobs: {max_jobs} must be at least 1.")
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.process = None
+        self.connection = None
+        self.jobs = 0
+        self.builds = []
+
+    # This is on the RenderWorker() class
+    @catch
+    def __enter__(self):
+        return self
+
+    # This is on the RenderWorker() class
+    @catch
+    def __exit__(self, *_exc_info):
+        self.stop()
+        return False
+
+    # This is on the RenderWorker() class
+    @catch
+    def start(self):
+        # spawn (not fork) so the worker never inherits locks held by other threads
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=render_worker_main, args=(child_connection, self.memory_limit_mb), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.jobs = 0
+        logger.debug("Started render worker pid {}", self.process.pid)
+
+    # This is on the RenderWorker() class
+    @catch
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        if kill is False and self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        logger.debug("Stopped render worker pid {} after {} jobs", self.process.pid, self.jobs)
+        self.process = None
+        self.connection = None
+
+    # This is on the RenderWorker() class
+    @catch
+    def render(self, rst2pdf_argv=None):
+        """
+        Render one document with rst2pdf's command-line arguments ``rst2pdf_argv``; return a dict with ``returncode``, ``stderr``, ``runtime`` and ``peak_rss_kb``.
+        """
+        if self.process is None or not self.process.is_alive():
+            self.stop(kill=True)
+            self.start()
+
+        try:
+            self.connection.send((list(rst2pdf_argv), self.cpu_limit))
+            if not self.connection.poll(self.timeout):
+                self.stop(kill=True)
+                raise RenderLimitExceeded(f"rst2pdf was killed after exceeding the {self.timeout} second wall-clock limit (see --render_timeout): {' '.join(rst2pdf_argv)}")
+            result = self.connection.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # The worker died; find out why...
+            self.process.join(timeout=5.0)
+            exitcode = self.process.exitcode
+            self.stop(kill=True)
+            if exitcode == -signal.SIGXCPU:
+                raise RenderLimitExceeded(f"rst2pdf was killed after exceeding the {self.cpu_limit} second CPU limit (see --render_cpu_limit): {' '.join(rst2pdf_argv)}")
+            if exitcode == -signal.SIGKILL:
+                # Only the soft RLIMIT_CPU is lowered (SIGXCPU), so SIGKILL came from outside the worker
+                raise RenderLimitExceeded(f"The rst2pdf render worker was killed by SIGKILL (likely the kernel OOM killer): {' '.join(rst2pdf_argv)}")
+            if self.memory_limit_mb > 0:
+                raise RenderLimitExceeded(f"The rst2pdf render worker died unexpectedly with exitcode {exitcode}, possibly at the {self.memory_limit_mb} MiB address-space limit (see --render_memory_limit_mb): {' '.join(rst2pdf_argv)}")
+            raise RenderLimitExceeded(f"The rst2pdf render worker died unexpectedly with exitcode {exitcode}: {' '.join(rst2pdf_argv)}")
+
+        self.jobs += 1
+        self.builds.append(result)
+        logger.info("rst2pdf build took {:.3f} seconds; peak RSS {} KiB", result["runtime"], result["peak_rss_kb"])
+
+        if result["error"] == "MemoryError":
+            self.stop(kill=True)
+            raise RenderLimitExceeded(f"rst2pdf ran out of memory at the {self.memory_limit_mb} MiB address-space limit (see --render_memory_limit_mb): {' '.join(rst2pdf_argv)}")
+
+        # Recycle the worker before it becomes a problem...
+        if self.jobs >= self.max_jobs:
+            logger.debug("Recycling the render worker after {} jobs", self.jobs)
+            self.stop()
+        elif self.max_rss_mb > 0 and result["rss_kb"] is not None and result["rss_kb"] > self.max_rss_mb * 1024:
+            logger.debug("Recycling the render worker at {} KiB RSS", result["rss_kb"])
+            self.stop()
+
+        return result
+
+
+def valid_until_midnight(now=None):
+    """
+    Validity period of the date providers: the content is good until the next local midnight.
+    """
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return tomorrow.timestamp()
+
+
+def valid_this_run_only(now=None):
+    """
+    Validity period of providers which can change at any time (git, environment): re-evaluate on every run.
+    """
+    return 0.0
+
+
+def provide_localtime_today_as_words(context=None):
+    today = context["now"].date()
+    return today.strftime(f"%A %B {today.day}, {today.year}")
+
+
+def provide_localtime_today_iso(context=None):
+    return context["now"].date().isoformat()
+
+
+def provide_localtime_year(context=None):
+    return f"{context['now'].year}"
+
+
+def provide_git_revision(context=None):
+    output_namedtuple = run(
+        shlex.split("git rev-parse --short HEAD"),
+        shell=False,
+        capture_output=True,
+        cwd=context["document_directory"],
+    )
+    if output_namedtuple.returncode > 0:
+        return "unknown"
+    return output_namedtuple.stdout.decode(errors="replace").strip()
+
+
+def provide_rst2pdf_http_version(context=None):
+    return get_version_number(version_filename=DEFAULT_VERSION_FILEPATH)
+
+
+# name -> (provider, validity); each provider writes ``<name>.rst``.  Add entries here (or with register_generated_include()) to generate more includes.
+GENERATED_INCLUDE_PROVIDERS = {
+    "localtime_today_as_words": (provide_localtime_today_as_words, valid_until_midnight),
+    "localtime_today_iso": (provide_localtime_today_iso, valid_until_midnight),
+    "localtime_year": (provide_localtime_year, valid_until_midnight),
+    "git_revision": (provide_git_revision, valid_this_run_only),
+    "rst2pdf_http_version": (provide_rst2pdf_http_version, valid_this_run_only),
+}
+
+
+@catch
+def register_generated_include(name=None, provider=None, validity=valid_this_run_only):
+    """
+    Register ``provider(context) -> str`` to generate ``<name>.rst``; ``validity(now) -> timestamp`` says how long its content stays current.
+    """
+    if re.search(r"^[A-Za-z0-9_]+$", name or "") is None:
+        raise ValueError(f"{name} is an invalid generated include name.")
+    GENERATED_INCLUDE_PROVIDERS[name] = (provider, validity)
+
+
+class GeneratedIncludes(object):
+    """
+    Evaluate every generated-include provider in one pass and write ``<name>.rst`` into ``directory``.
+
+    A provider whose content is still within its validity period is not re-evaluated, and a file is only rewritten when its content actually changes; its mtime stays put otherwise, so caches and watchers downstream are not invalidated for nothing.
+
+    Validity timestamps are kept in ``.generated_includes.json`` next to the includes.
+    """
+
+    @catch
+    def __init__(self, directory=CUSTOM_STYLESHEET_DIRECTORY, document_directory=".", environment_names=None):
+        self.directory = directory
+        self.providers = dict(GENERATED_INCLUDE_PROVIDERS)
+        for env_name in environment_names or []:
+            if re.search(r"^[A-Za-z_][A-Za-z0-9_]*$", env_name) is None:
+                raise ValueError(f"{env_name} is an invalid environment variable name.")
+            self.providers[f"env_{env_name}"] = (lambda context, env_name=env_name: os.environ.get(env_name, ""), valid_this_run_only)
+        self.context = {
+            "now": datetime.datetime.now(),
+            "document_directory": os.path.abspath(document_directory or "."),
+        }
+        self.state_filepath = os.path.normpath(f"{directory}/{GENERATED_INCLUDES_STATE_FILENAME}")
+
+    # This is on the GeneratedIncludes() class
+    @catch
+    def write_all(self):
+        """
+        Return the names of the includes which were (re)written.
+        """
+        try:
+            with open(self.state_filepath, "r") as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            state = {}
+        previous_state = dict(state)
+
+        now_timestamp = self.context["now"].timestamp()
+        written = []
+        for name, (provider, validity) in sorted(self.providers.items()):
+            output_filepath = os.path.normpath(f"{self.directory}/{name}.rst")
+            if state.get(name, 0.0) > now_timestamp and os.path.exists(output_filepath):
+                continue
+
+            try:
+                content = provider(self.context)
+            except Exception as eee:
+                logger.warning(f"generated include '{name}' failed: {eee}")
+                continue
+            state[name] = validity(now=self.context["now"])
+
+            try:
+                with open(output_filepath, "r") as fh:
+                    unchanged = fh.read() == content
+            except OSError:
+                unchanged = False
+            if unchanged:
+                continue
+
+            logger.info("writing '{}' to {}", content, output_filepath)
+            tmp_filepath = f"{output_filepath}.tmp"
+            with open(tmp_filepath, "w") as fh:
+                fh.write(content)
+            os.replace(tmp_filepath, output_filepath)
+            written.append(name)
+
+        if state != previous_state:
+            tmp_filepath = f"{self.state_filepath}.tmp"
+            with open(tmp_filepath, "w") as fh:
+                json.dump(state, fh, indent=4, sort_keys=True)
+            os.replace(tmp_filepath, self.state_filepath)
+        return written
+
+
 class ThisApplication(object):
-    @logger.catch(reraise=True)
-    def __init__(self, start_filepath=None):
+    @catch
+    def __init__(self, start_filepath=None, cli_args=None):
         """
-        `start_filename` is the string filename.
+        `start_filename` is the string filename.  `cli_args` is the already-parsed ``parse_cli_args()`` namespace; if it is None, ``sys.argv`` is parsed again.
         """
 
         check_file_exists(start_filepath)
@@ -414,6 +875,9 @@ class ThisApplication(object):
 
         self.start_filepath = start_filepath
         self.start_filename = start_filename
+        self.last_build = None
+        self.last_optimize = None
+        self.dependencies = []
         self.start_filename_suffix = start_filename_suffix
 
         if start_filename_suffix == "rst":
@@ -426,7 +890,9 @@ class ThisApplication(object):
             self.finish_filename_suffix = start_filename_suffix
 
         # Technically we will call
-        if len(sys.argv) > 0:
+        if isinstance(cli_args, argparse.Namespace):
+            self.cli_args = cli_args
+        elif len(sys.argv) > 0:
             self.cli_args = parse_cli_args(sys.argv[1:])
         else:
             self.cli_args = None
@@ -436,36 +902,64 @@ class ThisApplication(object):
         self.write_custom_rst_imports_directory()
         self.write_custom_rst_imports()
 
-    @logger.catch(reraise=True)
-    def convert_rst_to_pdf(self, stylesheet_directory=None, stylesheet_filename=None):
+    @catch
+    def get_render_worker(self):
+        """
+        Build a ``RenderWorker()`` with the resource limits from the command-line.
+        """
+        return RenderWorker(
+            timeout=getattr(self.cli_args, "render_timeout", DEFAULT_RENDER_TIMEOUT),
+            cpu_limit=getattr(self.cli_args, "render_cpu_limit", DEFAULT_RENDER_CPU_LIMIT),
+            memory_limit_mb=getattr(self.cli_args, "render_memory_limit_mb", DEFAULT_RENDER_MEMORY_LIMIT_MB),
+            max_jobs=getattr(self.cli_args, "render_max_jobs", DEFAULT_RENDER_MAX_JOBS),
+            max_rss_mb=getattr(self.cli_args, "render_max_rss_mb", DEFAULT_RENDER_MAX_RSS_MB),
+        )
+
+    @catch
+    def convert_rst_to_pdf(self, stylesheet_directory=None, stylesheet_filename=None, render_worker=None):
+        """
+        Render ``start_filepath`` to ``finish_filepath`` in a ``RenderWorker()``.
+
+        Pass a long-lived ``render_worker`` to reuse (and recycle) one worker across many builds; otherwise a worker is started for this build only.
+        """
         if self.start_filename_suffix == "rst":
             check_file_exists(filepath=f"{self.start_filepath}")
             check_file_exists(filepath=f"{stylesheet_directory}/{stylesheet_filename}")
 
-            rst2pdf_cmd = f"rst2pdf --stylesheet-path={stylesheet_directory} --stylesheets={stylesheet_filename} {self.start_filepath} -o {self.finish_filepath}"
-            logger.info(f"{rst2pdf_cmd}")
-
-            output_namedtuple = run(
-                shlex.split(rst2pdf_cmd),
-                shell=False,
-                capture_output=True,
-            )
-            check_file_exists(self.finish_filepath)
+            rst2pdf_argv = [f"--stylesheet-path={stylesheet_directory}", f"--stylesheets={stylesheet_filename}", f"{self.start_filepath}", "-o", f"{self.finish_filepath}"]
+            logger.opt(lazy=True).info("rst2pdf {}", lambda: " ".join(rst2pdf_argv))
 
-            if output_namedtuple.stderr != b"":
-                logger.warning(output_namedtuple)
-                return True
-            elif output_namedtuple.returncode > 0:
-                logger.error(output_namedtuple)
-                raise OSError(output_namedtuple.stderr.strip())
+            if render_worker is None:
+                with self.get_render_worker() as this_render_worker:
+                    result = this_render_worker.render(rst2pdf_argv)
             else:
-                logger.debug(output_namedtuple)
-                return True
+                result = render_worker.render(rst2pdf_argv)
+            self.last_build = result
+
+            if result["returncode"] > 0:
+                logger.error(result)
+                raise OSError(result["error"] or result["stderr"].strip())
+            elif result["stderr"] != b"":
+                logger.warning(result["stderr"].decode(errors="replace").strip())
+            else:
+                logger.debug(result)
+            check_file_exists(self.finish_filepath)
+            return True
         else:
             logger.warning(f"The start filename suffix is not 'rst'.  No conversion is implemented for '{self.start_filename_suffix}'.")
             return False
 
-    @logger.catch(reraise=True)
+    @catch
+    def optimize_pdf(self):
+        """
+        Run the post-render ``optimize_pdf()`` stage on ``finish_filepath``.
+        """
+        if self.finish_filename_suffix != "pdf":
+            return None
+        self.last_optimize = optimize_pdf(self.finish_filepath)
+        return self.last_optimize
+
+    @catch
     def copy_file(self, src, dst):
         """copy_file(src, dst)
 
@@ -493,7 +987,7 @@ class ThisApplication(object):
         >>> app.copy_file("/tmp/this.txt", "/tmp/that.txt")
 
         """
-        logger.debug(f"copy {src} {dst}")
+        logger.debug("copy {} {}", src, dst)
         try:
             shutil.copy(src, dst)
             return True
@@ -504,7 +998,7 @@ class ThisApplication(object):
             logger.error(f"{eee}")
             return False
 
-    @logger.catch(reraise=True)
+    @catch
     def write_custom_rst_imports_directory(self):
         try:
             os.makedirs(f"{CUSTOM_STYLESHEET_DIRECTORY}")
@@ -516,7 +1010,7 @@ class ThisApplication(object):
             raise OSError(f"{eee}")
         return True
 
-    @logger.catch(reraise=True)
+    @catch
     def write_custom_rst_imports(self):
         """write_custom_rst_imports()
 
@@ -524,24 +1018,14 @@ class ThisApplication(object):
         """
 
         if self.cli_args.no_write_rst_imports is True:
-            self.write_localtime_today_as_words()
+            generated_includes = GeneratedIncludes(
+                directory=self.custom_rst_imports_directory,
+                document_directory=os.path.dirname(os.path.abspath(self.start_filepath)),
+                environment_names=getattr(self.cli_args, "include_env", None),
+            )
+            generated_includes.write_all()
 
-    @logger.catch(reraise=True)
-    def write_localtime_today_as_words(self):
-        """
-        Get the system local date, and save it as a file.
-        """
-        today = datetime.date.today()
-        day = today.day
-        month = today.month
-        year = today.year
-        output_filepath = os.path.normpath(f"{self.custom_rst_imports_directory}/localtime_today_as_words.rst")
-        today_as_words = datetime.date(year, month, day).strftime(f"%A %B {day}, {year}")
-        logger.info(f"writing '{today_as_words}' to {output_filepath}")
-        with open(output_filepath, "w+") as fh:
-            fh.write(today_as_words)
-
-    @logger.catch(reraise=True)
+    @catch
     def check_ipv46_addrs(self, ipv46_addrs):
         """
         Walk all the strings in ipv46_addrs and return True if they are all valid.
@@ -563,7 +1047,97 @@ class ThisApplication(object):
 
         return True
 
-    @logger.catch(reraise=True)
+    @catch
+    def log_local_urls(self, local_ipv46_addrs=None, webserver_port=0, url_path=""):
+        """
+        Log the URL of ``url_path`` on every non-loopback local address.
+        """
+        for v46addr in local_ipv46_addrs:
+            # Skip binding to loopback addresses... this is pointless.  If it's sufficient to bind
+            # to the loopback, then you dont need this script.
+            if re.search(r"^(::1|127\.\d+\.\d+\.\d+)$", v46addr):
+                continue
+            elif ":" in v46addr:
+                logger.success(f"Local URL --> http://[{v46addr}]:{webserver_port}/{url_path}")
+            else:
+                logger.success(f"Local URL --> http://{v46addr}:{webserver_port}/{url_path}")
+
+    @catch
+    def register_shared_document(self, shared_directory=DEFAULT_SHARED_WEBSERVER_DIRECTORY, with_pdf=False):
+        """
+        Copy this document into its own subdirectory of ``shared_directory`` and add (or update) it in the shared webserver registry.
+
+        The registry stays locked while the files are copied, so two documents can never claim the same name.  Each file is replaced with an atomic rename, so the shared webserver never serves a half-copied PDF.  Return the document name, which is also its URL path.
+        """
+        source = os.path.abspath(self.start_filepath)
+        with SharedWebserverRegistry(shared_directory=shared_directory) as registry:
+            document_name = get_shared_document_name(source, documents=registry.documents)
+            document_directory = os.path.normpath(f"{shared_directory}/{document_name}")
+            os.makedirs(document_directory, exist_ok=True)
+
+            filenames = [self.start_filename]
+            if with_pdf is True and self.finish_filename != self.start_filename:
+                filenames.append(self.finish_filename)
+
+            filepaths = {self.start_filename: self.start_filepath, self.finish_filename: self.finish_filepath}
+            for filename in filenames:
+                tmp_filepath = os.path.normpath(f"{document_directory}/.{filename}.tmp")
+                shutil.copyfile(filepaths[filename], tmp_filepath)
+                os.replace(tmp_filepath, os.path.normpath(f"{document_directory}/{filename}"))
+
+            registry.documents[document_name] = {
+                "name": document_name,
+                "main": filenames[-1],
+                "files": sorted(filenames),
+                "source": source,
+                "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+        logger.info("Registered '{}' with the shared webserver in {}", document_name, shared_directory)
+        return document_name
+
+    @catch
+    def start_shared_webserver(self, local_ipv46_addrs=None, webserver_port=0, with_pdf=False, shared_directory=DEFAULT_SHARED_WEBSERVER_DIRECTORY):
+        """
+        Register this document with the shared webserver; start the shared webserver only if it is not already listening on ``webserver_port``.
+
+        Return False if the shared webserver could not be started, i.e. another program holds ``webserver_port``.
+        """
+        if webserver_port == 0:
+            error = "Webserver port must not be 0"
+            raise ValueError(error)
+
+        self.check_ipv46_addrs(local_ipv46_addrs)
+
+        document_name = self.register_shared_document(shared_directory=shared_directory, with_pdf=with_pdf)
+        main_filename = self.finish_filename if with_pdf is True else self.start_filename
+
+        print("")
+        self.log_local_urls(local_ipv46_addrs=local_ipv46_addrs, webserver_port=webserver_port, url_path=f"{document_name}/{main_filename}")
+
+        if is_shared_webserver_listening(webserver_port=webserver_port):
+            logger.info("The shared webserver on TCP port {} is already running; it will serve '{}' immediately.", webserver_port, document_name)
+            return True
+
+        cmd = f"{os.getcwd()}/filesystem_webserver --webserverPort {webserver_port} --webserverDirectory {shared_directory} --shared --registryPath {get_shared_webserver_registry_filepath(shared_directory)}"
+        logger.info("Starting the shared webserver: {}", cmd)
+        try:
+            # This will block stdin...
+            returncode = call(
+                shlex.split(cmd),
+                shell=False,
+            )
+        except KeyboardInterrupt:
+            logger.info("    Webserver interrupted by KeyboardInterrupt.")
+            return True
+        except Exception as eee:
+            logger.error(f"   {eee}: Did you type `make all` before running the script?")
+            return False
+        if returncode != 0:
+            logger.error("-->{}<-- exited with returncode {}; is TCP port {} already used by another program?", cmd, returncode, webserver_port)
+            return False
+        return True
+
+    @catch
     def start_webserver(self, local_ipv46_addrs=None, webserver_port=0, with_pdf=False):
         """
         Create a temporary directory, copy files into it, and start webserver on all sockets.
@@ -592,15 +1166,7 @@ class ThisApplication(object):
             ###############################################################
             try:
                 print("")
-                for v46addr in local_ipv46_addrs:
-                    # Skip binding to loopback addresses... this is pointless.  If it's sufficient to bind
-                    # to the loopback, then you dont need this script.
-                    if re.search(r"^(::1|127\.\d+\.\d+\.\d+)$", v46addr):
-                        continue
-                    elif ":" in v46addr:
-                        logger.success(f"Local URL --> http://[{v46addr}]:{args.webserver_port}/")
-                    else:
-                        logger.success(f"Local URL --> http://{v46addr}:{args.webserver_port}/")
+                self.log_local_urls(local_ipv46_addrs=local_ipv46_addrs, webserver_port=webserver_port)
 
                 cmd = f"{os.getcwd()}/filesystem_webserver --webserverPort {webserver_port} --webserverDirectory {temp_dir}"
                 # This will block stdin...
@@ -623,7 +1189,7 @@ class ThisApplication(object):
                     logger.critical(error)
                     raise OSError(f"{cmd} failed to block and properly wait for input; investigate why it didn't block for input.")
                 else:
-                    logger.info(f"{cmd} exited with returncode: 0")
+                    logger.info("{} exited with returncode: 0", cmd)
             except OSError:
                 logger.error("Webserver failed to block and wait for input properly.")
                 sys.exit(1)
@@ -633,7 +1199,619 @@ class ThisApplication(object):
                 logger.error(f"   {eee}: Did you type `make all` before running the script?")
 
 
-@logger.catch(reraise=True)
+@catch
+def get_shared_document_name(filepath=None, documents=None):
+    """
+    Return the shared webserver document name (and URL path) for ``filepath``; i.e. ``CoverLetter_20230927`` for ``../CoverLetter_20230927.rst``.
+
+    ``documents`` is the current registry.  A source which is already registered keeps its name; if another source already uses the name (i.e. ``docs/a/README.rst`` and ``docs/b/README.rst``), a short hash of the source path is appended, i.e. ``README-1a2b3c4d``.
+    """
+    source = os.path.abspath(filepath)
+    stem = pathlib.PurePosixPath(source).stem
+    document_name = re.sub(r"[^A-Za-z0-9._-]", "_", stem).lstrip("._-")
+    if document_name == "":
+        raise ValueError(f"Cannot build a shared webserver document name from '{filepath}'.")
+
+    documents = documents or {}
+    for name, document in documents.items():
+        if document.get("source") == source:
+            return name
+    if document_name not in documents:
+        return document_name
+
+    disambiguated_name = f"{document_name}-{hashlib.sha1(source.encode()).hexdigest()[:8]}"
+    if disambiguated_name in documents:
+        raise ValueError(f"The shared webserver document name '{disambiguated_name}' for {source} is already used by {documents[disambiguated_name].get('source')}.")
+    return disambiguated_name
+
+
+@catch
+def get_shared_webserver_registry_filepath(shared_directory=DEFAULT_SHARED_WEBSERVER_DIRECTORY):
+    """
+    Return the registry filepath for ``shared_directory``.  It sits next to (not inside) the served directory, so the absolute ``source`` paths and the lock / temporary files are never served.
+    """
+    return os.path.join(f"{os.path.normpath(shared_directory)}.registry", SHARED_WEBSERVER_REGISTRY_FILENAME)
+
+
+class SharedWebserverRegistry(object):
+    """
+    The shared webserver registry as a context manager: ``documents`` is loaded under an exclusive ``flock()``, and written back on a clean exit.
+
+    Concurrent ``rst2pdf_http.py`` runs are serialized by the lock, and the registry is replaced with an atomic rename so the webserver never reads a partial file.
+    """
+
+    @catch
+    def __init__(self, shared_directory=DEFAULT_SHARED_WEBSERVER_DIRECTORY):
+        self.filepath = get_shared_webserver_registry_filepath(shared_directory)
+        self.lock_fh = None
+        self.documents = {}
+
+    # This is on the SharedWebserverRegistry() class
+    @catch
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        self.lock_fh = open(f"{self.filepath}.lock", "w")
+        fcntl.flock(self.lock_fh, fcntl.LOCK_EX)
+        try:
+            with open(self.filepath, "r") as fh:
+                self.documents = json.load(fh).get("documents", {})
+        except FileNotFoundError:
+            self.documents = {}
+        except (json.JSONDecodeError, AttributeError):
+            logger.warning(f"{self.filepath} is malformed; rebuilding it.")
+            self.documents = {}
+        return self
+
+    # This is on the SharedWebserverRegistry() class
+    @catch
+    def __exit__(self, exc_type, *_exc_info):
+        try:
+            if exc_type is None:
+                tmp_filepath = f"{self.filepath}.tmp"
+                with open(tmp_filepath, "w") as fh:
+                    json.dump({"documents": self.documents}, fh, indent=4, sort_keys=True)
+                os.replace(tmp_filepath, self.filepath)
+        finally:
+            # Closing the file releases the flock()
+            self.lock_fh.close()
+        return False
+
+
+@catch
+def is_shared_webserver_listening(webserver_port=0, timeout=2.0):
+    """
+    Return True if a shared ``filesystem_webserver`` already answers on ``webserver_port``.
+    """
+    url = f"http://127.0.0.1:{webserver_port}{SHARED_WEBSERVER_STATUS_PATH}"
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return "documents" in json.loads(response.read())
+    except Exception:
+        return False
+
+
+def get_pdf_object_digest(value=None, decoded=False, _memo=None, _stack=()):
+    """
+    Return a sha256 hex digest of the pikepdf object ``value`` which covers everything it references: streams contribute their data (raw, or ``decoded`` where pikepdf can decode it), and indirect objects are resolved recursively.  ``/Parent`` back-references are skipped.
+
+    Unlike ``repr()``, which truncates stream data, equal digests mean equal content.
+    """
+    import pikepdf
+
+    _memo = {} if _memo is None else _memo
+    objgen = value.objgen if isinstance(value, pikepdf.Object) else (0, 0)
+    if objgen != (0, 0):
+        if objgen in _memo:
+            return _memo[objgen]
+        if objgen in _stack:
+            # A reference cycle; the objects on the cycle are hashed by the caller
+            return f"cycle {_stack.index(objgen)}"
+        _stack = _stack + (objgen,)
+
+    hasher = hashlib.sha256()
+    if isinstance(value, pikepdf.Stream):
+        data = None
+        if decoded is True:
+            try:
+                data = value.read_bytes()
+            except pikepdf.PdfError:
+                # i.e. DCT images; compare the encoded bytes
+                data = None
+        hasher.update(b"stream " + (data if data is not None else value.read_raw_bytes()))
+        items = [(key, item) for key, item in value.items() if key not in ("/Length", "/Filter", "/DecodeParms") or data is None]
+        value = dict(items)
+    if isinstance(value, (pikepdf.Dictionary, dict)):
+        for key in sorted([str(ii) for ii in value.keys()]):
+            if key == "/Parent":
+                continue
+            hasher.update(f"key {key} ".encode() + get_pdf_object_digest(value[key], decoded=decoded, _memo=_memo, _stack=_stack).encode())
+    elif isinstance(value, pikepdf.Array):
+        for item in value:
+            hasher.update(b"item " + get_pdf_object_digest(item, decoded=decoded, _memo=_memo, _stack=_stack).encode())
+    elif isinstance(value, pikepdf.Object):
+        hasher.update(b"scalar " + value.unparse())
+    else:
+        hasher.update(f"python {type(value).__name__} {value!r}".encode())
+
+    digest = hasher.hexdigest()
+    if objgen != (0, 0):
+        _memo[objgen] = digest
+    return digest
+
+
+@catch
+def get_pdf_page_digests(pdf=None):
+    """
+    Return one digest per page of the decoded page contents and resources; optimization must not change them.
+    """
+    memo = {}
+    return [get_pdf_object_digest(page.obj, decoded=True, _memo=memo) for page in pdf.pages]
+
+
+@catch
+def optimize_pdf(filepath=None):
+    """
+    Shrink the PDF at ``filepath`` in place and return a report dict with the size before and after, and the seconds spent.
+
+    - Identical image / form XObjects are deduplicated, so each is stored once.
+    - Content streams are (re)compressed with Flate.
+    - Objects are packed into compressed object streams; unreferenced objects are dropped.
+    - Embedded fonts which are not already subsets are counted; rst2pdf (reportlab) subsets every TrueType font it embeds, so there is nothing further to subset.
+
+    This requires ``pikepdf``, which is only imported when the optimization stage runs.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        raise OSError("PDF optimization requires pikepdf; install it with `make pip`.")
+
+    runtime_start = time.time()
+    size_before = os.path.getsize(filepath)
+    deduplicated = 0
+    full_fonts = set()
+    with pikepdf.open(filepath) as pdf:
+        page_digests = get_pdf_page_digests(pdf)
+        digest_memo = {}
+        seen_xobjects = {}
+        for page in pdf.pages:
+            resources = page.obj.get("/Resources", {})
+
+            xobjects = resources.get("/XObject", {})
+            for name in list(xobjects.keys()):
+                xobject = xobjects[name]
+                if not isinstance(xobject, pikepdf.Stream):
+                    continue
+                # Identical stream data and dictionary, including everything it references (i.e. /SMask), means an identical XObject
+                key = get_pdf_object_digest(xobject, _memo=digest_memo)
+                if key in seen_xobjects and seen_xobjects[key].objgen != xobject.objgen:
+                    xobjects[name] = seen_xobjects[key]
+                    deduplicated += 1
+                else:
+                    seen_xobjects.setdefault(key, xobject)
+
+            for font in resources.get("/Font", {}).values():
+                descriptor = font.get("/FontDescriptor", None)
+                base_font = str(font.get("/BaseFont", ""))
+                # Subset fonts are tagged like /ABCDEF+DejaVuSans
+                if descriptor is not None and re.search(r"^/[A-Z]{6}\+", base_font) is None:
+                    if any([ii in descriptor for ii in ("/FontFile", "/FontFile2", "/FontFile3")]):
+                        full_fonts.add(base_font)
+
+        pdf.remove_unreferenced_resources()
+        tmp_filepath = os.path.join(os.path.dirname(os.path.abspath(filepath)), f".{os.path.basename(filepath)}.optimize.tmp")
+        pdf.save(
+            tmp_filepath,
+            compress_streams=True,
+            recompress_flate=True,
+            stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        )
+
+    # Only replace the original if every page still has the same (decoded) contents
+    with pikepdf.open(tmp_filepath) as optimized_pdf:
+        optimized_page_digests = get_pdf_page_digests(optimized_pdf)
+    if optimized_page_digests != page_digests:
+        os.remove(tmp_filepath)
+        changed = [str(index + 1) for index, (before, after) in enumerate(zip(page_digests, optimized_page_digests)) if before != after]
+        raise ValueError(f"Optimizing {filepath} changed the page output (pages {', '.join(changed) or 'count'}); the original PDF was kept.")
+    os.replace(tmp_filepath, filepath)
+
+    size_after = os.path.getsize(filepath)
+    report = {
+        "size_before": size_before,
+        "size_after": size_after,
+        "saved_percent": round(100.0 * (size_before - size_after) / size_before, 1) if size_before > 0 else 0.0,
+        "deduplicated_xobjects": deduplicated,
+        "unsubset_fonts": sorted(full_fonts),
+        "runtime": time.time() - runtime_start,
+    }
+    logger.info("Optimized {}: {} -> {} bytes ({}% smaller, {} duplicate XObjects) in {:.3f} seconds", filepath, size_before, size_after, report["saved_percent"], deduplicated, report["runtime"])
+    for font in report["unsubset_fonts"]:
+        logger.warning(f"{filepath} embeds the full (not subset) font {font}")
+    return report
+
+
+# Groups: the prefix, the directive (None for a ``:file:`` option), the reference and the trailing whitespace; shared with render_farm.py, which rewrites the references
+RST_DEPENDENCY_PATTERN = r"^(\s*\.\.\s+(?:\|[^|\n]+\|\s+)?(include|literalinclude|image|figure)::\s+|[ \t]+:file:\s+)(\S+)(\s*)$"
+
+
+@catch
+def scan_rst_dependencies(filepath=None, _seen=None):
+    """
+    Return ``(dependencies, missing)``: the absolute paths of every file ``filepath`` references with ``include``, ``literalinclude``, ``image`` or ``figure`` directives (also in substitution definitions) or ``:file:`` options, and the subset which do not exist.
+
+    Included RestructuredText is scanned recursively; relative paths are resolved against the including file's directory, like docutils does.  Standard includes such as ``<isonum.txt>`` are skipped.
+    """
+    if _seen is None:
+        _seen = set()
+    abspath = os.path.abspath(os.path.expanduser(filepath))
+    _seen.add(abspath)
+
+    dependencies = []
+    missing = []
+    try:
+        with open(abspath, "r", errors="replace") as fh:
+            text = fh.read()
+    except OSError:
+        return dependencies, [abspath]
+
+    for mm in re.finditer(RST_DEPENDENCY_PATTERN, text, re.MULTILINE):
+        directive, reference = mm.group(2), mm.group(3)
+        if reference.startswith("<"):
+            continue
+        dependency = os.path.normpath(os.path.join(os.path.dirname(abspath), os.path.expanduser(reference)))
+        if dependency in dependencies:
+            continue
+        dependencies.append(dependency)
+        if not os.path.exists(dependency):
+            missing.append(dependency)
+        elif directive == "include" and dependency not in _seen:
+            nested_dependencies, nested_missing = scan_rst_dependencies(dependency, _seen=_seen)
+            dependencies.extend([ii for ii in nested_dependencies if ii not in dependencies])
+            missing.extend([ii for ii in nested_missing if ii not in missing])
+
+    return dependencies, missing
+
+
+class StartupTimer(object):
+    """
+    Record when each startup step ran, and report the sequential (before) versus overlapped (after) critical path.
+    """
+
+    @catch
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = {}
+
+    # This is on the StartupTimer() class
+    async def run(self, name, func, *args, **kwargs):
+        """
+        Run the blocking ``func`` in a thread and record its start and finish times under ``name``.
+        """
+        step_start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            self.steps[name] = (step_start - self.start, time.perf_counter() - self.start)
+
+    # This is on the StartupTimer() class
+    @catch
+    def log_report(self, critical_path=()):
+        elapsed = time.perf_counter() - self.start
+        sequential = sum([finish - start for start, finish in self.steps.values()])
+        logger.info("Startup timing (seconds since start):")
+        for name, (start, finish) in sorted(self.steps.items(), key=lambda ii: ii[1][0]):
+            marker = "*" if name in critical_path else " "
+            logger.info("  {} {:<24} {:8.3f} -> {:8.3f}  ({:.3f})", marker, name, start, finish, finish - start)
+        logger.opt(lazy=True).info("  critical path (*): {}", lambda: " -> ".join([ii for ii in critical_path if ii in self.steps]))
+        logger.info("  before (sequential): {:.3f}  after (overlapped): {:.3f}", sequential, elapsed)
+
+
+async def run_startup_pipeline(args=None, timer=None):
+    """
+    Run the independent startup steps concurrently: port probing and address discovery overlap with writing the rst imports, the stylesheet, and the conversion itself.  Dependency scanning overlaps with the conversion; it starts once the rst imports it may include are written.
+
+    Return ``(app, ipv46_addrs)``.
+    """
+    background = []
+    if args.webserver_port > 0:
+        # A shared webserver is expected to be listening already...
+        if args.shared_webserver is False:
+            for address_family in sorted(VALID_IPADDRESS_FAMILIES):
+                background.append(timer.run(f"probe {address_family} port", get_unix_listening_port_sockets, address_family=address_family, tcp_port=args.webserver_port))
+        addrs_task = asyncio.ensure_future(timer.run("list local addresses", list_local_ipaddrs, terminal_encoding=args.terminal_encoding))
+    else:
+        addrs_task = None
+    background_task = asyncio.ensure_future(asyncio.gather(*background))
+    scan_task = None
+
+    foreground_finished = False
+    try:
+        stylesheet = Stylesheet(
+            cli_args=args,
+            font_attrs=args.font_attrs,
+            page_size=args.page_size,
+            page_orientation="Portriat",
+        )
+        app, _ = await asyncio.gather(
+            timer.run("write rst imports", ThisApplication, start_filepath=args.start_filepath, cli_args=args),
+            timer.run("write stylesheet", stylesheet.save_stylesheet_yaml, directory=args.stylesheet_directory, filename=args.stylesheet_filename),
+        )
+        scan_task = asyncio.ensure_future(timer.run("scan dependencies", scan_rst_dependencies, args.start_filepath))
+        await timer.run("convert", app.convert_rst_to_pdf, stylesheet_directory=args.stylesheet_directory, stylesheet_filename=args.stylesheet_filename)
+        if args.optimize_pdf is True:
+            await timer.run("optimize pdf", app.optimize_pdf)
+        foreground_finished = True
+    finally:
+        if foreground_finished is False:
+            # The foreground error is the one to report; retrieve (and discard) whatever the background steps raise
+            pending = [task for task in (background_task, addrs_task, scan_task) if task is not None]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    results = await background_task
+    if args.webserver_port > 0 and args.shared_webserver is False:
+        for address_family, tcp_port_open in zip(sorted(VALID_IPADDRESS_FAMILIES), results):
+            if tcp_port_open is False:
+                warning = f"Webserver socket still open  webserver on TCP port {args.webserver_port} ({address_family})."
+                logger.warning(warning)
+    app.dependencies, missing = await scan_task
+    for dependency in missing:
+        logger.warning(f"Missing include or image: {dependency}")
+
+    ipv46_addrs = await addrs_task if addrs_task is not None else []
+    return app, ipv46_addrs
+
+
+def check_rst_file(filepath=None):
+    """
+    Parse ``filepath`` with docutils (resolving includes and directives, including rst2pdf's own) without running the PDF writer.
+
+    Return a list of ERROR and SEVERE system messages as dicts with ``file``, ``line``, ``level`` and ``message``.  This runs in ``ProcessPoolExecutor()`` workers, so it is deliberately not wrapped with ``logger.catch()``.
+    """
+    import docutils.frontend
+    import docutils.parsers.rst
+    import docutils.utils
+
+    abspath = os.path.abspath(os.path.expanduser(filepath))
+    try:
+        with open(abspath, "r", encoding="utf-8-sig") as fh:
+            text = fh.read()
+    except (OSError, UnicodeDecodeError) as eee:
+        return [{"file": filepath, "line": None, "level": "SEVERE", "message": f"{type(eee).__name__}: {eee}"}]
+
+    parser = docutils.parsers.rst.Parser()
+    settings = docutils.frontend.get_default_settings(parser)
+    # Collect messages with an observer instead of printing (report_level) or raising (halt_level) them
+    settings.report_level = 5
+    settings.halt_level = 5
+    settings.warning_stream = io.StringIO()
+    document = docutils.utils.new_document(abspath, settings)
+
+    problems = []
+
+    def observe(message):
+        if message["level"] >= CHECK_FAILURE_LEVEL:
+            problems.append(
+                {
+                    "file": message.get("source") or abspath,
+                    "line": message.get("line"),
+                    "level": DOCUTILS_LEVEL_NAMES.get(message["level"], str(message["level"])),
+                    "message": message.children[0].astext() if len(message.children) > 0 else message.astext(),
+                }
+            )
+
+    document.reporter.attach_observer(observe)
+    try:
+        parser.parse(text, document)
+    except Exception as eee:
+        problems.append({"file": abspath, "line": None, "level": "SEVERE", "message": f"{type(eee).__name__}: {eee}"})
+    return problems
+
+
+@catch
+def run_check_mode(filepaths=None, jobs=None, check_format=DEFAULT_CHECK_FORMAT, stream=sys.stdout):
+    """
+    Check every file in ``filepaths`` with ``check_rst_file()`` across a process pool and write one line per problem to ``stream``.
+
+    Return the process exit code: 0 if every file parsed without ERROR or SEVERE messages, otherwise 1.
+    """
+    if check_format not in VALID_CHECK_FORMATS:
+        raise ValueError(f"{check_format} is an invalid check format. Choose from: {sorted(VALID_CHECK_FORMATS)}.")
+
+    # Register rst2pdf's directives (i.e. oddeven, header) once, before forking the pool
+    import rst2pdf.createpdf  # noqa: F401
+
+    jobs = jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(filepaths))
+    if jobs <= 1:
+        results = [check_rst_file(filepath) for filepath in filepaths]
+    else:
+        # fork is much faster than spawn here; no other threads are running in check mode
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+            results = list(executor.map(check_rst_file, filepaths, chunksize=max(1, len(filepaths) // (jobs * 4))))
+
+    failures = 0
+    for problems in results:
+        for problem in problems:
+            failures += 1
+            if check_format == "json":
+                stream.write(json.dumps(problem) + "\n")
+            else:
+                message = " ".join(problem["message"].split())
+                stream.write(f"{problem['file']}:{problem['line'] or 0}: ({problem['level']}) {message}\n")
+    stream.flush()
+    logger.info("Checked {} files with {} jobs: {} errors", len(filepaths), jobs, failures)
+    return 1 if failures > 0 else 0
+
+
+class BuildHistory(object):
+    """
+    A small SQLite log of every build: input hashes, stylesheet and other output-affecting parameters, per-phase durations, peak memory and output size.
+
+    ``record_in_background()`` hashes the inputs and writes the row in a separate thread, so the build and the webserver never wait on the database.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS builds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished TEXT NOT NULL,
+            document TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            stylesheet_hash TEXT NOT NULL,
+            stylesheet_params TEXT NOT NULL,
+            phases TEXT NOT NULL,
+            total_seconds REAL NOT NULL,
+            peak_rss_kb INTEGER,
+            output_size INTEGER,
+            cache_hit INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS builds_document ON builds (document, id);
+    """
+
+    @catch
+    def __init__(self, filepath=DEFAULT_BUILD_HISTORY_FILEPATH):
+        self.filepath = filepath
+
+    # This is on the BuildHistory() class
+    @catch
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+        connection = sqlite3.connect(self.filepath, timeout=10.0)
+        # WAL lets --report read while a build writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    # This is on the BuildHistory() class
+    @catch
+    def get_input_hash(self, filepaths=None):
+        """
+        Hash the contents of ``filepaths`` (the document and everything it includes); missing files hash as their path only.
+        """
+        digest = hashlib.sha256()
+        for filepath in sorted(set(filepaths)):
+            digest.update(filepath.encode())
+            try:
+                with open(filepath, "rb") as fh:
+                    for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            except OSError:
+                pass
+        return digest.hexdigest()
+
+    # This is on the BuildHistory() class
+    @catch
+    def record(self, app=None, cli_args=None, timer=None):
+        """
+        Insert one row for the build ``app`` just finished.
+
+        ``stylesheet_params`` holds every option which changes the PDF; ``cache_hit`` is 1 when the inputs are identical to the previous build of the same document with the same parameters, i.e. when a build cache could have skipped it.
+        """
+        document = os.path.abspath(app.start_filepath)
+        input_hash = self.get_input_hash([document] + list(app.dependencies))
+        stylesheet_params = {
+            "page_size": cli_args.page_size,
+            "page_orientation": cli_args.page_orientation,
+            "page_margins": cli_args.page_margins,
+            "page_gutter": cli_args.page_gutter,
+            "page_header_footer_spacing": cli_args.page_header_footer_spacing,
+            "font_name": cli_args.font_name,
+            "font_size": cli_args.font_size,
+            "font_attrs": sorted(cli_args.font_attrs or []),
+            "optimize_pdf": cli_args.optimize_pdf,
+            "write_rst_imports": cli_args.no_write_rst_imports,
+            "include_env": sorted(getattr(cli_args, "include_env", None) or []),
+        }
+        stylesheet_params_json = json.dumps(stylesheet_params, sort_keys=True)
+        stylesheet_hash = hashlib.sha256(stylesheet_params_json.encode()).hexdigest()
+        phases = {name: round(finish - start, 6) for name, (start, finish) in timer.steps.items()}
+        total_seconds = max([finish for _, finish in timer.steps.values()] or [0.0])
+        peak_rss_kb = app.last_build["peak_rss_kb"] if app.last_build is not None else None
+        output_size = os.path.getsize(app.finish_filepath) if os.path.exists(app.finish_filepath) else None
+
+        connection = self.connect()
+        try:
+            with connection:
+                previous = connection.execute("SELECT input_hash FROM builds WHERE document = ? AND stylesheet_hash = ? ORDER BY id DESC LIMIT 1", (document, stylesheet_hash)).fetchone()
+                cache_hit = previous == (input_hash,)
+                connection.execute(
+                    "INSERT INTO builds (finished, document, input_hash, stylesheet_hash, stylesheet_params, phases, total_seconds, peak_rss_kb, output_size, cache_hit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (datetime.datetime.now().isoformat(timespec="seconds"), document, input_hash, stylesheet_hash, stylesheet_params_json, json.dumps(phases), total_seconds, peak_rss_kb, output_size, int(cache_hit)),
+                )
+        finally:
+            connection.close()
+        logger.debug("Recorded the {} build in {}", document, self.filepath)
+        return True
+
+    # This is on the BuildHistory() class
+    @catch
+    def record_in_background(self, **kwargs):
+        """
+        Run ``record()`` in a thread; a failed write is logged, never raised into the build.
+        """
+
+        def record_quietly():
+            try:
+                self.record(**kwargs)
+            except Exception as eee:
+                logger.warning(f"Could not record the build in {self.filepath}: {eee}")
+
+        thread = threading.Thread(target=record_quietly, name="build-history")
+        thread.start()
+        return thread
+
+    # This is on the BuildHistory() class
+    @catch
+    def report(self, threshold=DEFAULT_REPORT_THRESHOLD, builds=DEFAULT_REPORT_BUILDS, console=None):
+        """
+        Print the last ``builds`` builds of each document, flagging any build whose time, peak RSS or output size is more than ``threshold`` (a fraction) above the median of the builds before it with the same parameters.
+
+        Return the number of flagged builds.
+        """
+        console = console or Console()
+        connection = self.connect()
+        try:
+            documents = [ii[0] for ii in connection.execute("SELECT DISTINCT document FROM builds ORDER BY document")]
+            flagged = 0
+            for document in documents:
+                rows = connection.execute(
+                    "SELECT finished, total_seconds, peak_rss_kb, output_size, cache_hit, phases, stylesheet_hash FROM builds WHERE document = ? ORDER BY id DESC LIMIT ?",
+                    (document, builds),
+                ).fetchall()
+                rows.reverse()
+
+                table = Table(title=document)
+                for column in ("finished", "params", "seconds", "convert", "peak RSS KiB", "bytes", "cache hit", "regressed"):
+                    table.add_column(column, no_wrap=(column == "finished"))
+                for index, (finished, total_seconds, peak_rss_kb, output_size, cache_hit, phases, stylesheet_hash) in enumerate(rows):
+                    regressions = []
+                    for name, column_index in (("time", 1), ("rss", 2), ("size", 3)):
+                        # i.e. --optimize_pdf or another page size legitimately changes the time and size
+                        baseline = [ii[column_index] for ii in rows[:index] if ii[column_index] is not None and ii[6] == stylesheet_hash]
+                        value = rows[index][column_index]
+                        if len(baseline) > 0 and value is not None and value > statistics.median(baseline) * (1.0 + threshold):
+                            regressions.append(name)
+                    flagged += 1 if len(regressions) > 0 else 0
+                    table.add_row(
+                        finished,
+                        stylesheet_hash[:8],
+                        f"{total_seconds:.3f}",
+                        f"{json.loads(phases).get('convert', 0.0):.3f}",
+                        f"{peak_rss_kb}",
+                        f"{output_size}",
+                        "yes" if cache_hit else "no",
+                        f"[red]{', '.join(regressions)}[/red]" if len(regressions) > 0 else "",
+                    )
+                console.print(table)
+        finally:
+            connection.close()
+        console.print(f"{flagged} builds regressed by more than {threshold:.0%}.")
+        return flagged
+
+
+@catch
 def get_version_number(version_filename="resources/version.json"):
     version_digits_file = None
     version_digits = None
@@ -655,7 +1833,7 @@ def get_version_number(version_filename="resources/version.json"):
         raise ValueError(error)
 
 
-@logger.catch(reraise=True)
+@catch
 def parse_cli_args(sys_argv1):
     """
     Reference: https://docs.python.org/3/library/argparse.html
@@ -761,8 +1939,46 @@ def parse_cli_args(sys_argv1):
         action="store",
         help=f"rst2pdf stylesheet_filename; the default is '{DEFAULT_STYLESHEET_FILENAME}'.",
     )
+    parser_optional.add_argument(
+        "--shared_webserver",
+        default=False,
+        action="store_true",
+        help="Register the document with one long-lived shared webserver on --webserver_port (started if it is not already running) instead of starting a webserver for this document only.",
+    )
+    parser_optional.add_argument(
+        "--shared_webserver_directory",
+        type=str,
+        default=DEFAULT_SHARED_WEBSERVER_DIRECTORY,
+        action="store",
+        help=f"Directory served by the shared webserver; the default is '{DEFAULT_SHARED_WEBSERVER_DIRECTORY}'.",
+    )
+    parser_optional.add_argument("--render_timeout", type=float, default=DEFAULT_RENDER_TIMEOUT, action="store", help=f"Kill rst2pdf after this many wall-clock seconds; the default is {DEFAULT_RENDER_TIMEOUT}.")
+    parser_optional.add_argument("--render_cpu_limit", type=int, default=DEFAULT_RENDER_CPU_LIMIT, action="store", help=f"Kill rst2pdf after this many CPU seconds (RLIMIT_CPU); 0 is unlimited.  The default is {DEFAULT_RENDER_CPU_LIMIT}.")
+    parser_optional.add_argument("--render_memory_limit_mb", type=int, default=DEFAULT_RENDER_MEMORY_LIMIT_MB, action="store", help=f"rst2pdf address-space limit in MiB (RLIMIT_AS); 0 is unlimited.  The default is {DEFAULT_RENDER_MEMORY_LIMIT_MB}.")
+    parser_optional.add_argument("--render_max_jobs", type=int, default=DEFAULT_RENDER_MAX_JOBS, action="store", help=f"Recycle the rst2pdf render worker after this many builds; the default is {DEFAULT_RENDER_MAX_JOBS}.")
+    parser_optional.add_argument("--render_max_rss_mb", type=int, default=DEFAULT_RENDER_MAX_RSS_MB, action="store", help=f"Recycle the rst2pdf render worker when its resident memory exceeds this many MiB; 0 disables the check.  The default is {DEFAULT_RENDER_MAX_RSS_MB}.")
+    parser_optional.add_argument("--check", type=str, default=None, nargs="+", metavar="FILEPATH", help="Only parse these RestructuredText files (resolving includes and directives, without rendering a PDF) and report ERROR / SEVERE messages; exit non-zero if there are any.")
+    parser_optional.add_argument("--check_jobs", type=int, default=None, action="store", help="Number of --check worker processes; the default is the number of CPUs.")
+    parser_optional.add_argument(
+        "--check_format",
+        type=str,
+        default=DEFAULT_CHECK_FORMAT,
+        choices=sorted(VALID_CHECK_FORMATS),
+        action="store",
+        help=f"--check output: 'json' (one JSON object per line) or 'text' (file:line: (LEVEL) message); the default is '{DEFAULT_CHECK_FORMAT}'.",
+    )
+    parser_optional.add_argument("--optimize_pdf", default=False, action="store_true", help="After rendering, deduplicate images, recompress streams and pack objects to shrink the PDF (requires pikepdf).")
+    parser_optional.add_argument("--build_history", type=str, default=DEFAULT_BUILD_HISTORY_FILEPATH, action="store", help=f"SQLite build history database; the default is '{DEFAULT_BUILD_HISTORY_FILEPATH}'.")
+    parser_optional.add_argument("--no_build_history", default=False, action="store_true", help="Don't record this build in the build history database.")
+    parser_optional.add_argument("--report", default=False, action="store_true", help="Print build history trends per document, flag regressed builds, and exit.")
+    parser_optional.add_argument("--report_threshold", type=float, default=DEFAULT_REPORT_THRESHOLD, action="store", help=f"Flag builds more than this fraction slower / larger than the median of earlier builds; the default is {DEFAULT_REPORT_THRESHOLD}.")
+    parser_optional.add_argument("--report_builds", type=int, default=DEFAULT_REPORT_BUILDS, action="store", help=f"Number of recent builds per document in --report; the default is {DEFAULT_REPORT_BUILDS}.")
+    parser_optional.add_argument("--timing_report", default=False, action="store_true", help="Log how long each startup step took, and the sequential versus overlapped critical path.")
     parser_optional.add_argument("-t", "--terminal_encoding", type=str, default="UTF-8", choices=None, action="store", help=f"Use this manual terminal encoding.  The auto-detected default is {DEFAULT_TERMINAL_ENCODING}")
+    parser_optional.add_argument("--include_env", type=str, default=None, action="append", metavar="NAME", help=f"Also write the environment variable NAME to {CUSTOM_STYLESHEET_DIRECTORY}/env_NAME.rst; may be repeated.")
     parser_optional.add_argument("--no_write_rst_imports", default=True, action="store_false", help=f"Don't write the canned rst imports file to {CUSTOM_STYLESHEET_DIRECTORY}/custom_rst_imports.")
+    parser_optional.add_argument("--log_level", type=str, default=DEFAULT_LOG_LEVEL, choices=VALID_LOG_LEVELS, action="store", help=f"Only log messages at or above this level; the default is {DEFAULT_LOG_LEVEL}.  INFO or higher also skips formatting debug messages.")
+    parser_optional.add_argument("-q", "--quiet", default=False, action="store_true", help=f"Only log warnings and errors (the same as --log_level {QUIET_LOG_LEVEL}); for batch and daemon use.")
     parser_optional.add_argument("-v", "--version", default=False, action="store_true", help="Output the script version number to stdout.")
 
     args = parser.parse_args(sys_argv1)
@@ -787,7 +2003,7 @@ def parse_cli_args(sys_argv1):
     return args
 
 
-@logger.catch(reraise=True)
+@catch
 def is_valid_ipv4addr(addr, raise_error=True):
     """
     Check whether ``addr`` is a valid IPv4 address; if so, return True.
@@ -833,7 +2049,7 @@ def is_valid_ipv4addr(addr, raise_error=True):
             return False
 
 
-@logger.catch(reraise=True)
+@catch
 def is_valid_ipv6addr(addr, raise_error=True):
     """
     Check whether ``addr`` is a valid IPv6 address; if so, return True.
@@ -879,7 +2095,7 @@ def is_valid_ipv6addr(addr, raise_error=True):
             return False
 
 
-@logger.catch(reraise=True)
+@catch
 def nix_list_local_ipaddrs(terminal_encoding=None):
     """
     List the local ip addresses on a *nix machine with `ifconfig -a`.
@@ -902,7 +2118,7 @@ def nix_list_local_ipaddrs(terminal_encoding=None):
         raise ValueError("No ipv4_addrs or ipv6_addrs found.")
 
 
-@logger.catch(reraise=True)
+@catch
 def list_local_ipaddrs(**kwargs):
     # platforms from
     #     https://stackoverflow.com/a/13874620
@@ -919,31 +2135,45 @@ def list_local_ipaddrs(**kwargs):
         raise ValueError(f"Unsupported sys.platform: {pltfm}.")
 
 
-if __name__ == "__main__":
+def main(sys_argv1=None):
+    """
+    Run rst2pdf_http.py with the CLI options in ``sys_argv1``; return the process exit code.
+    """
     check_supported_platform()
-    args = parse_cli_args(sys.argv[1:])
-
-    if args.webserver_port > 0:
-        for address_family in sorted(VALID_IPADDRESS_FAMILIES):
-            tcp_port_open = get_unix_listening_port_sockets(address_family=address_family, tcp_port=args.webserver_port)
-            if tcp_port_open is False:
-                warning = f"Webserver socket still open  webserver on TCP port {args.webserver_port}."
-                logger.warning(warning)
-
-    app = ThisApplication(start_filepath=args.start_filepath)
-    stylesheet = Stylesheet(
-        cli_args=args,
-        font_attrs=args.font_attrs,
-        page_size=args.page_size,
-        page_orientation="Portriat",
-    )
-    stylesheet.save_stylesheet_yaml(
-        directory=args.stylesheet_directory,
-        filename=args.stylesheet_filename,
-    )
+    # Parse the CLI once; everything below shares `args`
+    args = parse_cli_args(sys_argv1)
+    configure_logging(log_level=args.log_level, quiet=args.quiet)
+
+    if args.start_filepath is None and args.check is None and args.report is False:
+        logger.error("-f / --start_filepath is required (unless --check or --report is used).")
+        return 2
+
+    if args.check is not None:
+        return run_check_mode(filepaths=args.check, jobs=args.check_jobs, check_format=args.check_format)
+
+    if args.report is True:
+        BuildHistory(filepath=args.build_history).report(threshold=args.report_threshold, builds=args.report_builds)
+        return 0
+
+    startup_timer = StartupTimer()
+    app, ipv46_addrs = asyncio.run(run_startup_pipeline(args=args, timer=startup_timer))
+    if args.timing_report is True:
+        # The conversion waits for whichever of the rst imports or the stylesheet finished last
+        slowest_prerequisite = max(("write rst imports", "write stylesheet"), key=lambda name: startup_timer.steps[name][1])
+        startup_timer.log_report(critical_path=(slowest_prerequisite, "convert", "optimize pdf"))
+
+    if args.no_build_history is False:
+        BuildHistory(filepath=args.build_history).record_in_background(app=app, cli_args=args, timer=startup_timer)
+
+    if args.webserver_port > 0 and args.shared_webserver is True:
+        if app.start_shared_webserver(local_ipv46_addrs=ipv46_addrs, webserver_port=args.webserver_port, with_pdf=True, shared_directory=args.shared_webserver_directory) is False:
+            return 1
+    elif args.webserver_port > 0:
+        app.start_webserver(local_ipv46_addrs=ipv46_addrs, webserver_port=args.webserver_port, with_pdf=True)
+    return 0
 
-    app.convert_rst_to_pdf(stylesheet_directory=args.stylesheet_directory, stylesheet_filename=args.stylesheet_filename)
 
-    ipv46_addrs = list_local_ipaddrs(terminal_encoding=args.terminal_encoding)
-    if args.webserver_port > 0:
-        app.start_webserver(local_ipv46_addrs=ipv46_addrs, webserver_port=args.webserver_port, with_pdf=True)
+if __name__ == "__main__":
+    # The process boundary: log any uncaught exception once, with its traceback, and exit non-zero
+    with logger.catch(onerror=lambda _: sys.exit(1)):
+        sys.exit(main(sys.argv[1:]))
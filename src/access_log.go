@@ -0,0 +1,77 @@
+package main
+
+import (
+	"io"
+	"sync"
+	"sync/atomic"
+)
+
+// asyncAccessLog is an io.Writer that hands each access log line to a
+// background goroutine through a bounded channel.  If the channel is full
+// (i.e. the terminal is slower than the request rate) the line is dropped and
+// counted instead of blocking the request handler.
+type asyncAccessLog struct {
+	output  io.Writer
+	lines   chan []byte
+	dropped atomic.Uint64
+	written atomic.Uint64
+	done    chan struct{}
+	once    sync.Once
+}
+
+// newAsyncAccessLog starts the background writer; `bufferLines` is the
+// number of lines which may be queued before new lines are dropped.
+func newAsyncAccessLog(output io.Writer, bufferLines int) *asyncAccessLog {
+	if bufferLines < 1 {
+		bufferLines = 1
+	}
+	accessLog := &asyncAccessLog{
+		output: output,
+		lines:  make(chan []byte, bufferLines),
+		done:   make(chan struct{}),
+	}
+	go accessLog.run()
+	return accessLog
+}
+
+func (accessLog *asyncAccessLog) run() {
+	defer close(accessLog.done)
+	for line := range accessLog.lines {
+		// a failed write to stdout is not worth stopping the webserver for...
+		if _, err := accessLog.output.Write(line); err == nil {
+			accessLog.written.Add(1)
+		}
+	}
+}
+
+// Write never blocks; gorilla/handlers reuses its buffer, so the line is
+// copied before it is queued.
+func (accessLog *asyncAccessLog) Write(line []byte) (int, error) {
+	queued := make([]byte, len(line))
+	copy(queued, line)
+	select {
+	case accessLog.lines <- queued:
+	default:
+		accessLog.dropped.Add(1)
+	}
+	return len(line), nil
+}
+
+// Dropped returns the number of access log lines discarded so far.
+func (accessLog *asyncAccessLog) Dropped() uint64 {
+	return accessLog.dropped.Load()
+}
+
+// Written returns the number of access log lines written so far.
+func (accessLog *asyncAccessLog) Written() uint64 {
+	return accessLog.written.Load()
+}
+
+// Close flushes the queued lines and stops the background writer.  Write
+// must not be called after Close.
+func (accessLog *asyncAccessLog) Close() {
+	accessLog.once.Do(func() {
+		close(accessLog.lines)
+	})
+	<-accessLog.done
+}
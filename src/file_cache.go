@@ -0,0 +1,286 @@
+package main
+
+import (
+	"bytes"
+	"container/list"
+	"io"
+	"io/fs"
+	"net/http"
+	"os"
+	"path"
+	"path/filepath"
+	"strings"
+	"sync"
+	"sync/atomic"
+	"time"
+
+	"github.com/fsnotify/fsnotify"
+	"github.com/gleich/logoru"
+)
+
+// cacheEntry is one regular file held in memory.
+type cacheEntry struct {
+	name    string
+	content []byte
+	modTime time.Time
+}
+
+// cacheLoad lets concurrent misses on the same file wait for a single read
+// from disk instead of all reading the same (possibly 50 MB) file.
+type cacheLoad struct {
+	done  chan struct{}
+	entry *cacheEntry
+}
+
+// fileCache serves hot files from `root` out of memory.  It is bounded by
+// `maxBytes` with least-recently-used eviction; files larger than
+// `maxFileBytes` and directories are always handed to `fallback`.
+//
+// Entries are invalidated by fsnotify events under `root`; Invalidate()
+// bumps the cache generation and flushes every entry.
+type fileCache struct {
+	root         http.FileSystem
+	fallback     http.Handler
+	maxBytes     int64
+	maxFileBytes int64
+
+	mu         sync.Mutex
+	usedBytes  int64
+	generation uint64
+	entries    map[string]*list.Element
+	lru        *list.List
+	loading    map[string]*cacheLoad
+
+	hits      atomic.Uint64
+	misses    atomic.Uint64
+	evictions atomic.Uint64
+}
+
+func newFileCache(root http.FileSystem, fallback http.Handler, maxBytes int64, maxFileBytes int64) *fileCache {
+	return &fileCache{
+		root:         root,
+		fallback:     fallback,
+		maxBytes:     maxBytes,
+		maxFileBytes: maxFileBytes,
+		entries:      make(map[string]*list.Element),
+		lru:          list.New(),
+		loading:      make(map[string]*cacheLoad),
+	}
+}
+
+func (cache *fileCache) ServeHTTP(w http.ResponseWriter, r *http.Request) {
+	if r.Method != http.MethodGet && r.Method != http.MethodHead {
+		cache.fallback.ServeHTTP(w, r)
+		return
+	}
+
+	name := path.Clean("/" + r.URL.Path)
+	// directory listings, redirects and index.html handling stay with http.FileServer
+	if strings.HasSuffix(r.URL.Path, "/") || strings.HasSuffix(name, "/index.html") {
+		cache.fallback.ServeHTTP(w, r)
+		return
+	}
+
+	entry := cache.get(name)
+	if entry == nil {
+		cache.fallback.ServeHTTP(w, r)
+		return
+	}
+	// ServeContent sets Content-Length and handles Range / If-Modified-Since
+	http.ServeContent(w, r, entry.name, entry.modTime, bytes.NewReader(entry.content))
+}
+
+// get returns the cached entry for `name`, loading it from disk on a miss.
+// It returns nil if the file cannot (or should not) be cached.
+func (cache *fileCache) get(name string) *cacheEntry {
+	cache.mu.Lock()
+	if element, ok := cache.entries[name]; ok {
+		cache.lru.MoveToFront(element)
+		cache.mu.Unlock()
+		cache.hits.Add(1)
+		return element.Value.(*cacheEntry)
+	}
+	if load, ok := cache.loading[name]; ok {
+		cache.mu.Unlock()
+		<-load.done
+		cache.misses.Add(1)
+		return load.entry
+	}
+	load := &cacheLoad{done: make(chan struct{})}
+	cache.loading[name] = load
+	generation := cache.generation
+	cache.mu.Unlock()
+
+	cache.misses.Add(1)
+	load.entry = cache.read(name)
+
+	cache.mu.Lock()
+	delete(cache.loading, name)
+	// do not store content read before an invalidation
+	if load.entry != nil && generation == cache.generation {
+		cache.insert(load.entry)
+	}
+	cache.mu.Unlock()
+	close(load.done)
+	return load.entry
+}
+
+// read loads `name` through `root` so http.Dir() path sanitizing still applies.
+func (cache *fileCache) read(name string) *cacheEntry {
+	fh, err := cache.root.Open(name)
+	if err != nil {
+		return nil
+	}
+	defer fh.Close()
+
+	info, err := fh.Stat()
+	if err != nil || !info.Mode().IsRegular() || info.Size() > cache.maxFileBytes || info.Size() > cache.maxBytes {
+		return nil
+	}
+	content, err := io.ReadAll(io.LimitReader(fh, cache.maxFileBytes+1))
+	if err != nil || int64(len(content)) > cache.maxFileBytes {
+		return nil
+	}
+	return &cacheEntry{name: name, content: content, modTime: info.ModTime()}
+}
+
+// insert must be called with `cache.mu` held.
+func (cache *fileCache) insert(entry *cacheEntry) {
+	size := int64(len(entry.content))
+	for cache.usedBytes+size > cache.maxBytes && cache.lru.Len() > 0 {
+		cache.remove(cache.lru.Back())
+		cache.evictions.Add(1)
+	}
+	cache.entries[entry.name] = cache.lru.PushFront(entry)
+	cache.usedBytes += size
+}
+
+// remove must be called with `cache.mu` held.
+func (cache *fileCache) remove(element *list.Element) {
+	entry := cache.lru.Remove(element).(*cacheEntry)
+	delete(cache.entries, entry.name)
+	cache.usedBytes -= int64(len(entry.content))
+}
+
+// InvalidateName drops `name` from the cache.
+func (cache *fileCache) InvalidateName(name string) {
+	cache.mu.Lock()
+	defer cache.mu.Unlock()
+	cache.generation++
+	if element, ok := cache.entries[name]; ok {
+		cache.remove(element)
+	}
+}
+
+// InvalidateTree drops `name` and every entry under the `name + "/"`
+// directory prefix; a removed or renamed directory takes its files with it.
+func (cache *fileCache) InvalidateTree(name string) {
+	cache.mu.Lock()
+	defer cache.mu.Unlock()
+	cache.generation++
+	prefix := strings.TrimSuffix(name, "/") + "/"
+	for entryName, element := range cache.entries {
+		if entryName == name || strings.HasPrefix(entryName, prefix) {
+			cache.remove(element)
+		}
+	}
+}
+
+// Invalidate starts a new cache generation and drops every entry.
+func (cache *fileCache) Invalidate() {
+	cache.mu.Lock()
+	defer cache.mu.Unlock()
+	cache.generation++
+	cache.entries = make(map[string]*list.Element)
+	cache.lru.Init()
+	cache.usedBytes = 0
+}
+
+// Stats returns hits, misses, evictions and the bytes currently cached.
+func (cache *fileCache) Stats() (uint64, uint64, uint64, int64) {
+	cache.mu.Lock()
+	usedBytes := cache.usedBytes
+	cache.mu.Unlock()
+	return cache.hits.Load(), cache.misses.Load(), cache.evictions.Load(), usedBytes
+}
+
+// HitRate returns the percentage of requests served from memory.
+func (cache *fileCache) HitRate() float64 {
+	hits, misses := cache.hits.Load(), cache.misses.Load()
+	if hits+misses == 0 {
+		return 0.0
+	}
+	return 100.0 * float64(hits) / float64(hits+misses)
+}
+
+// logFileCacheStats logs one line of cache statistics.
+func logFileCacheStats(cache *fileCache) {
+	hits, misses, evictions, usedBytes := cache.Stats()
+	logoru.Info("File cache hits:", hits, "misses:", misses, "hit rate:", int(cache.HitRate()), "percent; evictions:", evictions, "cached bytes:", usedBytes)
+}
+
+// watchFileCache invalidates cache entries when files under `directory`
+// change.  fsnotify watches are not recursive, so every subdirectory is
+// added (including ones created later).
+func watchFileCache(cache *fileCache, directory string) (*fsnotify.Watcher, error) {
+	absDirectory, err := filepath.Abs(directory)
+	if err != nil {
+		return nil, err
+	}
+	watcher, err := fsnotify.NewWatcher()
+	if err != nil {
+		return nil, err
+	}
+	err = filepath.WalkDir(absDirectory, func(walkPath string, dirEntry fs.DirEntry, walkErr error) error {
+		if walkErr == nil && dirEntry.IsDir() {
+			return watcher.Add(walkPath)
+		}
+		return nil
+	})
+	if err != nil {
+		watcher.Close()
+		return nil, err
+	}
+
+	go func() {
+		for {
+			select {
+			case event, ok := <-watcher.Events:
+				if !ok {
+					return
+				}
+				relPath, err := filepath.Rel(absDirectory, event.Name)
+				if err != nil {
+					cache.Invalidate()
+					continue
+				}
+				name := path.Clean("/" + filepath.ToSlash(relPath))
+				if event.Has(fsnotify.Remove) || event.Has(fsnotify.Rename) {
+					// publishing with tmp + rename emits a Rename for the temp
+					// name; only flush what lived at (or under) that name
+					cache.InvalidateTree(name)
+					continue
+				}
+				cache.InvalidateName(name)
+				if event.Has(fsnotify.Create) {
+					if info, err := os.Stat(event.Name); err == nil && info.IsDir() {
+						if err := watcher.Add(event.Name); err != nil {
+							logoru.Warning("Cannot watch", event.Name, err)
+						}
+						// files may have been created (or moved in) before the
+						// watch was added
+						cache.InvalidateTree(name)
+					}
+				}
+			case err, ok := <-watcher.Errors:
+				if !ok {
+					return
+				}
+				// events may have been lost (i.e. queue overflow); start over
+				logoru.Warning("File cache watcher:", err)
+				cache.Invalidate()
+			}
+		}
+	}()
+	return watcher, nil
+}
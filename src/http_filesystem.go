@@ -1,24 +1,169 @@
 package main
 
 import (
+	"context"
+	"errors"
+	"net"
 	"net/http"
 	"os"
+	"os/signal"
+	"syscall"
+	"time"
 
 	"github.com/gleich/logoru"
 	"github.com/gorilla/handlers"
 	"github.com/spf13/pflag"
+	"golang.org/x/net/http2"
+	"golang.org/x/net/http2/h2c"
+	"golang.org/x/net/netutil"
 )
 
 func main() {
 	var webserverPort *string = pflag.String("webserverPort", "8080", "HTTP port that the webserver listens on; the default is 8080")
 	var webserverDirectory *string = pflag.String("webserverDirectory", ".", "HTTP directory to be served from; the default is '.'.")
+	var readHeaderTimeout *time.Duration = pflag.Duration("readHeaderTimeout", 10*time.Second, "Maximum time to read the HTTP request headers; the default is 10s.")
+	var readTimeout *time.Duration = pflag.Duration("readTimeout", 30*time.Second, "Maximum time to read the whole HTTP request; the default is 30s.")
+	var writeTimeout *time.Duration = pflag.Duration("writeTimeout", 10*time.Minute, "Maximum time to write the HTTP response (large PDFs over slow links need a generous value); the default is 10m.")
+	var idleTimeout *time.Duration = pflag.Duration("idleTimeout", 2*time.Minute, "Maximum time to keep an idle keep-alive connection open; the default is 2m.")
+	var shutdownTimeout *time.Duration = pflag.Duration("shutdownTimeout", 5*time.Second, "Maximum time to wait for in-flight requests after SIGINT / SIGTERM; the default is 5s.")
+	var maxConnections *int = pflag.Int("maxConnections", 256, "Maximum number of concurrent TCP connections; 0 is unlimited.  The default is 256.")
+	var enableH2C *bool = pflag.Bool("h2c", false, "Also serve cleartext HTTP/2 (h2c) on the webserver port; the default is HTTP/1.1 only.")
+	var accessLogBuffer *int = pflag.Int("accessLogBuffer", 4096, "Number of access log lines buffered before new lines are dropped; the default is 4096.")
+	var accessLogReportInterval *time.Duration = pflag.Duration("accessLogReportInterval", 30*time.Second, "How often dropped access log lines are reported; 0 disables the report.  The default is 30s.")
+	var cacheBytes *int64 = pflag.Int64("cacheBytes", 256<<20, "Maximum bytes of hot files cached in memory; 0 disables the file cache.  The default is 256 MiB.")
+	var cacheMaxFileBytes *int64 = pflag.Int64("cacheMaxFileBytes", 64<<20, "Files larger than this are always served from disk; the default is 64 MiB.")
+	var shared *bool = pflag.Bool("shared", false, "Serve many documents from webserverDirectory, one subdirectory per document, indexed by its registry.json; the default is a single-document directory.")
+	var registryPath *string = pflag.String("registryPath", "", "Shared webserver registry.json, kept outside webserverDirectory; the default is '<webserverDirectory>.registry/registry.json'.")
+	var cacheReportInterval *time.Duration = pflag.Duration("cacheReportInterval", 60*time.Second, "How often file cache hit rates are logged; 0 disables the report.  The default is 60s.")
 	pflag.Parse()
 
 	logoru.Info("Go Webserver listening on tcp port", *webserverPort)
 
-	// serve `webserver_directory` as the http root: / and log all to os.Stdout
-	http.Handle("/", handlers.CombinedLoggingHandler(os.Stdout, http.FileServer(http.Dir(*webserverDirectory))))
-	// serve from all external ipv4 and ipv6 addresses
-	http.ListenAndServe(":"+*webserverPort, nil)
+	// log all requests to os.Stdout without letting a slow terminal throttle the webserver
+	accessLog := newAsyncAccessLog(os.Stdout, *accessLogBuffer)
 
+	// serve `webserver_directory` as the http root: /
+	var fileHandler http.Handler = http.FileServer(http.Dir(*webserverDirectory))
+	var cache *fileCache
+	if *cacheBytes > 0 {
+		cache = newFileCache(http.Dir(*webserverDirectory), fileHandler, *cacheBytes, *cacheMaxFileBytes)
+		watcher, err := watchFileCache(cache, *webserverDirectory)
+		if err != nil {
+			// without change notifications the cache could serve stale files
+			logoru.Warning("File cache disabled; cannot watch", *webserverDirectory, err)
+			cache = nil
+		} else {
+			defer watcher.Close()
+			fileHandler = cache
+			if *cacheReportInterval > 0 {
+				go reportFileCacheStats(cache, *cacheReportInterval)
+			}
+		}
+	}
+	if *shared {
+		// render the document index pages once per registry change, not per request
+		if *registryPath == "" {
+			*registryPath = defaultRegistryPath(*webserverDirectory)
+		}
+		registry := newDocumentRegistry(*registryPath, fileHandler)
+		registryWatcher, err := watchRegistry(registry)
+		if err != nil {
+			logoru.Critical("Cannot watch the shared webserver registry", err)
+			os.Exit(1)
+		}
+		defer registryWatcher.Close()
+		fileHandler = registry
+	}
+	var handler http.Handler = handlers.CombinedLoggingHandler(accessLog, fileHandler)
+	if *enableH2C {
+		handler = h2c.NewHandler(handler, &http2.Server{IdleTimeout: *idleTimeout})
+	}
+
+	server := &http.Server{
+		// serve from all external ipv4 and ipv6 addresses
+		Addr:              ":" + *webserverPort,
+		Handler:           handler,
+		ReadHeaderTimeout: *readHeaderTimeout,
+		ReadTimeout:       *readTimeout,
+		WriteTimeout:      *writeTimeout,
+		IdleTimeout:       *idleTimeout,
+	}
+
+	listener, err := net.Listen("tcp", server.Addr)
+	if err != nil {
+		logoru.Critical("Cannot listen on tcp port", *webserverPort, err)
+		os.Exit(1)
+	}
+	if *maxConnections > 0 {
+		listener = netutil.LimitListener(listener, *maxConnections)
+	}
+
+	if *accessLogReportInterval > 0 {
+		go reportDroppedAccessLogLines(accessLog, *accessLogReportInterval)
+	}
+
+	// shutdown gracefully so buffered access log lines are flushed
+	signals := make(chan os.Signal, 1)
+	signal.Notify(signals, os.Interrupt, syscall.SIGTERM, syscall.SIGHUP)
+	serverStopped := make(chan struct{})
+	go func() {
+		defer close(serverStopped)
+		for received := range signals {
+			if received != syscall.SIGHUP {
+				break
+			}
+			// SIGHUP starts a new file cache generation
+			if cache != nil {
+				cache.Invalidate()
+				logoru.Info("File cache invalidated by SIGHUP")
+			}
+		}
+		ctx, cancel := context.WithTimeout(context.Background(), *shutdownTimeout)
+		defer cancel()
+		if err := server.Shutdown(ctx); err != nil {
+			logoru.Warning("Webserver shutdown:", err)
+		}
+	}()
+
+	if err := server.Serve(listener); !errors.Is(err, http.ErrServerClosed) {
+		logoru.Critical("Webserver failed:", err)
+		accessLog.Close()
+		os.Exit(1)
+	}
+	<-serverStopped
+
+	accessLog.Close()
+	logoru.Info("Access log lines written:", accessLog.Written(), "dropped:", accessLog.Dropped())
+	if cache != nil {
+		logFileCacheStats(cache)
+	}
+}
+
+// reportDroppedAccessLogLines logs a warning whenever more access log lines
+// were dropped since the previous report.
+func reportDroppedAccessLogLines(accessLog *asyncAccessLog, interval time.Duration) {
+	var reported uint64
+	ticker := time.NewTicker(interval)
+	defer ticker.Stop()
+	for range ticker.C {
+		if dropped := accessLog.Dropped(); dropped > reported {
+			logoru.Warning("Access log lines dropped under load:", dropped-reported, "total:", dropped)
+			reported = dropped
+		}
+	}
+}
+
+// reportFileCacheStats logs the file cache hit rate whenever there were new
+// requests since the previous report.
+func reportFileCacheStats(cache *fileCache, interval time.Duration) {
+	var reported uint64
+	ticker := time.NewTicker(interval)
+	defer ticker.Stop()
+	for range ticker.C {
+		hits, misses, _, _ := cache.Stats()
+		if hits+misses > reported {
+			logFileCacheStats(cache)
+			reported = hits + misses
+		}
+	}
 }
@@ -0,0 +1,234 @@
+package main
+
+import (
+	"bytes"
+	"encoding/json"
+	"html/template"
+	"net/http"
+	"os"
+	"path"
+	"path/filepath"
+	"regexp"
+	"sort"
+	"strings"
+	"sync"
+	"time"
+
+	"github.com/fsnotify/fsnotify"
+	"github.com/gleich/logoru"
+)
+
+// registeredDocument is one entry in the shared webserver registry.json,
+// which rst2pdf_http.py writes.
+type registeredDocument struct {
+	Name    string   `json:"name"`
+	Main    string   `json:"main"`
+	Files   []string `json:"files"`
+	Source  string   `json:"source"`
+	Updated string   `json:"updated"`
+}
+
+type registryFile struct {
+	Documents map[string]registeredDocument `json:"documents"`
+}
+
+// renderedIndex is an index page rendered once per registry change.
+type renderedIndex struct {
+	content []byte
+	modTime time.Time
+}
+
+var validDocumentName = regexp.MustCompile(`^[A-Za-z0-9][A-Za-z0-9._-]*$`)
+
+// registryStatusPath answers "is a shared webserver listening here?" without
+// exposing registry.json (which holds absolute source paths).  Document names
+// cannot start with a dot, so it never shadows a document.
+const registryStatusPath = "/.rst2pdf_http/status"
+
+// defaultRegistryPath keeps the registry (and its .lock / .tmp files) next to,
+// not inside, the served directory; rst2pdf_http.py uses the same path.
+func defaultRegistryPath(webserverDirectory string) string {
+	return filepath.Join(filepath.Clean(webserverDirectory)+".registry", "registry.json")
+}
+
+// hasDotSegment reports whether any element of `urlPath` is hidden (i.e. the
+// .<file>.tmp files that rst2pdf_http.py renames into place).
+func hasDotSegment(urlPath string) bool {
+	for _, segment := range strings.Split(urlPath, "/") {
+		if strings.HasPrefix(segment, ".") {
+			return true
+		}
+	}
+	return false
+}
+
+var registryIndexTemplate = template.Must(template.New("index").Parse(`<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>rst2pdf_http documents</title></head>
+<body>
+<h1>Documents</h1>
+<ul>
+{{- range .}}
+<li><a href="/{{.Name}}/{{.Main}}">{{.Name}}</a> (<a href="/{{.Name}}/">files</a>) updated {{.Updated}}</li>
+{{- end}}
+</ul>
+</body></html>
+`))
+
+var documentIndexTemplate = template.Must(template.New("document").Parse(`<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{{.Name}}</title></head>
+<body>
+<h1>{{.Name}}</h1>
+<p>Updated {{.Updated}}</p>
+<ul>
+{{- range .Files}}
+<li><a href="/{{$.Name}}/{{.}}">{{.}}</a></li>
+{{- end}}
+</ul>
+<p><a href="/">All documents</a></p>
+</body></html>
+`))
+
+// documentRegistry serves the top-level and per-document index pages of
+// a shared webserver from memory; everything else (except hidden files)
+// goes to `next`.
+type documentRegistry struct {
+	registryPath string
+	next         http.Handler
+
+	mu      sync.RWMutex
+	indexes map[string]renderedIndex
+	status  renderedIndex
+}
+
+func newDocumentRegistry(registryPath string, next http.Handler) *documentRegistry {
+	registry := &documentRegistry{registryPath: registryPath, next: next}
+	registry.Reload()
+	return registry
+}
+
+// Reload re-reads registry.json and re-renders every index page.  A missing
+// registry is an empty one; a malformed one keeps the previous pages.
+func (registry *documentRegistry) Reload() {
+	documents := registryFile{}
+	content, err := os.ReadFile(registry.registryPath)
+	if err == nil {
+		if err := json.Unmarshal(content, &documents); err != nil {
+			logoru.Error("Cannot parse", registry.registryPath, err)
+			return
+		}
+	} else if !os.IsNotExist(err) {
+		logoru.Error("Cannot read", registry.registryPath, err)
+		return
+	}
+
+	sorted := make([]registeredDocument, 0, len(documents.Documents))
+	for name, document := range documents.Documents {
+		document.Name = name
+		if !validDocumentName.MatchString(name) {
+			logoru.Warning("Skipping invalid registry document name:", name)
+			continue
+		}
+		sorted = append(sorted, document)
+	}
+	sort.Slice(sorted, func(ii, jj int) bool { return sorted[ii].Name < sorted[jj].Name })
+
+	now := time.Now()
+	indexes := make(map[string]renderedIndex, len(sorted)+1)
+	var rendered bytes.Buffer
+	if err := registryIndexTemplate.Execute(&rendered, sorted); err != nil {
+		logoru.Error("Cannot render the registry index:", err)
+		return
+	}
+	indexes["/"] = renderedIndex{content: bytes.Clone(rendered.Bytes()), modTime: now}
+	for _, document := range sorted {
+		rendered.Reset()
+		if err := documentIndexTemplate.Execute(&rendered, document); err != nil {
+			logoru.Error("Cannot render the index for", document.Name, err)
+			return
+		}
+		indexes["/"+document.Name+"/"] = renderedIndex{content: bytes.Clone(rendered.Bytes()), modTime: now}
+	}
+
+	status, err := json.Marshal(map[string]int{"documents": len(sorted)})
+	if err != nil {
+		logoru.Error("Cannot render the registry status:", err)
+		return
+	}
+
+	registry.mu.Lock()
+	registry.indexes = indexes
+	registry.status = renderedIndex{content: status, modTime: now}
+	registry.mu.Unlock()
+	logoru.Info("Registry loaded with", len(sorted), "documents")
+}
+
+func (registry *documentRegistry) ServeHTTP(w http.ResponseWriter, r *http.Request) {
+	if r.URL.Path == registryStatusPath {
+		registry.mu.RLock()
+		status := registry.status
+		registry.mu.RUnlock()
+		w.Header().Set("Content-Type", "application/json")
+		http.ServeContent(w, r, "status.json", status.modTime, bytes.NewReader(status.content))
+		return
+	}
+	if hasDotSegment(r.URL.Path) {
+		http.NotFound(w, r)
+		return
+	}
+
+	urlPath := strings.TrimSuffix(r.URL.Path, "index.html")
+	if strings.HasSuffix(urlPath, "/") {
+		name := path.Clean(urlPath)
+		if name != "/" {
+			name += "/"
+		}
+		registry.mu.RLock()
+		index, ok := registry.indexes[name]
+		registry.mu.RUnlock()
+		if ok {
+			w.Header().Set("Content-Type", "text/html; charset=utf-8")
+			http.ServeContent(w, r, "index.html", index.modTime, bytes.NewReader(index.content))
+			return
+		}
+	}
+	registry.next.ServeHTTP(w, r)
+}
+
+// watchRegistry reloads the registry whenever registry.json is replaced.
+// rst2pdf_http.py writes it with an atomic rename, so the directory (not the
+// file) is watched.
+func watchRegistry(registry *documentRegistry) (*fsnotify.Watcher, error) {
+	if err := os.MkdirAll(filepath.Dir(registry.registryPath), 0o755); err != nil {
+		return nil, err
+	}
+	watcher, err := fsnotify.NewWatcher()
+	if err != nil {
+		return nil, err
+	}
+	if err := watcher.Add(filepath.Dir(registry.registryPath)); err != nil {
+		watcher.Close()
+		return nil, err
+	}
+	registryName := filepath.Base(registry.registryPath)
+
+	go func() {
+		for {
+			select {
+			case event, ok := <-watcher.Events:
+				if !ok {
+					return
+				}
+				if filepath.Base(event.Name) == registryName && !event.Has(fsnotify.Chmod) {
+					registry.Reload()
+				}
+			case err, ok := <-watcher.Errors:
+				if !ok {
+					return
+				}
+				logoru.Warning("Registry watcher:", err)
+				registry.Reload()
+			}
+		}
+	}()
+	return watcher, nil
+}